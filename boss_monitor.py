@@ -6,16 +6,28 @@ import schedule
 import time
 import logging
 
-from config import (
-    SLACK_WEBHOOK_URL, SLACK_CHANNEL, SLACK_USERNAME, SLACK_ICON_EMOJI,
-    BOSS_MAP_URL, CHECK_INTERVAL_MINUTES, USER_ID_MAPPING, DEFAULT_USER_ID,
-    LOCATION_TRACK_CHANNEL, LOCATION_CHECK_INTERVAL_MINUTES
-)
+from config import DFPROFILER_BASE_URL, DEFAULT_USER_ID
+from clock import SystemClock
+from map_grid import MapGrid, flag_names, load_map_grid
+from notifiers import NotificationDispatcher, build_notifiers
+from position_cache import PositionCache, extract_profile_location
+from rendering import BUNKER_LOCATION, MessageRenderer, RenderedMessage
+from settings import DEFAULT_SETTINGS, Settings, SettingsStore, thaw
+from transport import HttpTransport
 
 # 設置日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# dfprofiler JSON 請求標頭
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://www.dfprofiler.com/bossmap',
+    'X-Requested-With': 'XMLHttpRequest',
+}
+
 
 class BossInfo:
     """Boss資訊類別"""
@@ -33,18 +45,20 @@ class BossInfo:
 
 class SmallBossInfo:
     """Small Boss資訊類別"""
-    def __init__(self, game_id: str, name: str, start_time: datetime, end_time: datetime, location: tuple):
+    def __init__(self, game_id: str, name: str, start_time: datetime, end_time: datetime, location: tuple,
+                 bunker_location: tuple = BUNKER_LOCATION):
         self.game_id = game_id
         self.name = name
         self.start_time = start_time
         self.end_time = end_time
         self.location = location  # (x, y) 座標
+        self.bunker_location = bunker_location
         self.duration_minutes = int((end_time - start_time).total_seconds() / 60)
         self.distance_from_bunker = self._calculate_distance_description()
     
     def _calculate_distance_description(self):
         """計算與Secronom Bunker的相對位置描述"""
-        bunker_x, bunker_y = 1054, 987
+        bunker_x, bunker_y = self.bunker_location
         boss_x, boss_y = int(self.location[0]), int(self.location[1])
         
         dx = boss_x - bunker_x  # 正數為右，負數為左
@@ -75,12 +89,32 @@ class SmallBossInfo:
 
 class PlayerLocation:
     """角色位置類別"""
-    def __init__(self, user_id: str, username: str, x: int, y: int):
+    def __init__(self, user_id: str, username: str, x: int, y: int, recent_positions: Optional[List[tuple]] = None):
         self.user_id = user_id
         self.username = username
         self.x = x
         self.y = y
         self.location = (x, y)
+        self.recent_positions = recent_positions or []  # [(timestamp, x, y), ...] 由舊到新
+    
+    def describe_movement(self) -> Optional[str]:
+        """根據最近的位置記錄描述移動狀態"""
+        if len(self.recent_positions) < 2:
+            return None
+        
+        latest_time = self.recent_positions[-1][0]
+        stationary_since = latest_time
+        for timestamp, x, y in reversed(self.recent_positions[:-1]):
+            if (x, y) != self.location:
+                break
+            stationary_since = timestamp
+        
+        if stationary_since < latest_time:
+            return f"已停留 {int((latest_time - stationary_since) / 60)} 分鐘"
+        
+        previous_time, previous_x, previous_y = self.recent_positions[-2]
+        _, direction = PlayerLocation(self.user_id, self.username, previous_x, previous_y).calculate_distance_to(self.location)
+        return f"最近移動: {direction} ({max(1, int((latest_time - previous_time) / 60))}分鐘內)"
     
     def calculate_distance_to(self, target_location: tuple) -> tuple:
         """計算到目標位置的距離，返回(距離, 方向描述)"""
@@ -112,39 +146,99 @@ class PlayerLocation:
 class BossMonitor:
     """Boss監控類別"""
     
-    def __init__(self, user_id: str = DEFAULT_USER_ID):
+    def __init__(self, user_id: str = DEFAULT_USER_ID, dispatcher: Optional[NotificationDispatcher] = None,
+                 map_grid: Optional[MapGrid] = None, clock=None, transport=None, base_url: Optional[str] = None,
+                 position_cache: Optional[PositionCache] = None, settings: Optional[Settings] = None):
         self.current_big_bosses: Dict[str, BossInfo] = {}
         self.current_small_bosses: Dict[str, SmallBossInfo] = {}
         self.user_id = user_id
+        self.settings = settings or DEFAULT_SETTINGS
+        # 未指定時自行建立通知渠道，設定變更時會重建
+        self._owns_dispatcher = dispatcher is None
+        self.dispatcher = dispatcher or NotificationDispatcher(build_notifiers(thaw(self.settings.notification_sinks)))
+        # 時鐘和HTTP傳輸可替換，用於回放和測試
+        self.clock = clock or SystemClock()
+        self.transport = transport or HttpTransport()
+        self.base_url = (base_url or DFPROFILER_BASE_URL).rstrip('/')
+        # 角色位置緩存（可在多個監控實例間共用）
+        self.position_cache = position_cache or PositionCache(
+            min_interval=self.settings.location_interval_minutes * 60,
+            max_interval=self.settings.position_poll_max_interval_minutes * 60,
+            capacity=self.settings.position_history_size,
+        )
+        # 預編譯的地圖格子（map_grid.bin 不存在時為None，不影響其他功能）
+        self.map_grid = map_grid or load_map_grid()
+        self.cell_filter = self.settings.boss_cell_filter
+        # 訊息渲染（緩存每隻boss的片段）
+        self.renderer = MessageRenderer(describe_location=self.describe_location)
+        # 目前排程中的定時任務 {名稱: schedule.Job}
+        self._jobs: Dict[str, schedule.Job] = {}
+    
+    def apply_settings(self, settings: Settings):
+        """套用新設定；已通知的boss、位置緩存和渲染緩存等執行期狀態保持不變"""
+        # 先建立新的通知渠道，失敗時不改變任何狀態
+        new_notifiers = None
+        if self._owns_dispatcher and settings.notification_sinks != self.settings.notification_sinks:
+            new_notifiers = build_notifiers(thaw(settings.notification_sinks))
+
+        self.settings = settings
+        self.cell_filter = settings.boss_cell_filter
+        self.position_cache.min_interval = settings.location_interval_minutes * 60
+        self.position_cache.max_interval = settings.position_poll_max_interval_minutes * 60
+        self.position_cache.resize(settings.position_history_size)
+        if new_notifiers is not None:
+            self.dispatcher.replace_notifiers(new_notifiers)
+            logger.info("通知渠道已按新設定重建")
+    
+    def is_cell_allowed(self, location: tuple) -> bool:
+        """檢查位置的格子類型是否符合 boss_cell_filter"""
+        if not self.cell_filter or not self.map_grid:
+            return True
+        return self.map_grid.has_flag(location[0], location[1], self.cell_filter)
+    
+    def describe_location(self, location: tuple) -> str:
+        """以地圖格子資訊描述位置（區域和最近地標）"""
+        if not self.map_grid:
+            return ""
+        cell = self.map_grid.cell_at(location[0], location[1])
+        if not cell:
+            return ""
+        parts = []
+        if cell.label or cell.title:
+            zone = str(cell)
+            if cell.flags:
+                zone += f" [{', '.join(flag_names(cell.flags))}]"
+            parts.append(f"Zone: {zone}")
+        landmark = self.map_grid.nearest_landmark(location[0], location[1])
+        # 最近地標就是Bunker錨點時不重複顯示（訊息中已有相對Bunker的距離）
+        if landmark and landmark[1:3] != tuple(self.settings.bunker_location):
+            name, _, _, distance = landmark
+            parts.append(f"Nearest landmark: {name} ({distance}格)")
+        return "\n".join(parts)
+    
+    def fetch_bossmap_json(self) -> dict:
+        """請求bossmap JSON原始數據（錯誤時拋出異常）"""
+        # 生成當前時間戳作為URL參數
+        timestamp = int(self.clock.time() * 1000)
+        json_url = f"{self.base_url}/bossmap/json/?_={timestamp}"
+        
+        logger.info(f"正在請求JSON數據: {json_url}")
+        return self.transport.get_json(json_url, headers=REQUEST_HEADERS, timeout=30)
     
-    def fetch_boss_data(self) -> tuple[List[BossInfo], List[SmallBossInfo]]:
+    def fetch_boss_data(self, data: Optional[dict] = None) -> tuple[List[BossInfo], List[SmallBossInfo]]:
         """
-        獲取當前boss資料
+        獲取當前boss資料（可傳入已獲取的bossmap數據以避免重複請求）
         返回: (big_bosses, small_bosses)
         """
         try:
-            # 生成當前時間戳作為URL參數
-            timestamp = int(time.time() * 1000)
-            json_url = f"https://www.dfprofiler.com/bossmap/json/?_={timestamp}"
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'application/json, text/javascript, */*; q=0.01',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Referer': 'https://www.dfprofiler.com/bossmap',
-                'X-Requested-With': 'XMLHttpRequest',
-            }
-            
-            logger.info(f"正在請求JSON數據: {json_url}")
-            response = requests.get(json_url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
+            if data is None:
+                data = self.fetch_bossmap_json()
             big_bosses = []
             small_bosses = []
             
-            # Secronom Bunker 座標
-            bunker_x, bunker_y = 1054, 987
+            # Secronom Bunker 座標和Small Boss範圍
+            bunker_x, bunker_y = self.settings.bunker_location
+            small_boss_range = self.settings.small_boss_range
             
             # 解析JSON數據
             for game_id, boss_data in data.items():
@@ -163,7 +257,7 @@ class BossMonitor:
                     
                     start_time = datetime.fromtimestamp(start_timestamp)
                     end_time = datetime.fromtimestamp(end_timestamp)
-                    current_time = datetime.now()
+                    current_time = self.clock.now()
                     
                     # 跳過已經結束的歷史boss
                     if end_time <= current_time:
@@ -188,7 +282,7 @@ class BossMonitor:
                             boss_x, boss_y = int(location[0]), int(location[1])
                             distance = max(abs(boss_x - bunker_x), abs(boss_y - bunker_y))
                             
-                            if distance <= 3:
+                            if distance <= small_boss_range and self.is_cell_allowed(location):
                                 nearby_locations.append(location)
                         
                         # 為每個在範圍內的位置創建一個Small Boss條目
@@ -196,11 +290,12 @@ class BossMonitor:
                             for i, location in enumerate(nearby_locations):
                                 # 為多個位置的同一boss添加位置索引
                                 boss_display_name = boss_name if len(nearby_locations) == 1 else f"{boss_name} #{i+1}"
-                                small_boss_info = SmallBossInfo(f"{game_id}_{i}", boss_display_name, start_time, end_time, tuple(location))
+                                small_boss_info = SmallBossInfo(f"{game_id}_{i}", boss_display_name, start_time, end_time, tuple(location),
+                                                                self.settings.bunker_location)
                                 small_bosses.append(small_boss_info)
                                 logger.info(f"找到Small Boss: {boss_display_name} (遊戲ID: {game_id}, 位置: {location}, 距離Bunker: {small_boss_info.distance_from_bunker})")
                         else:
-                            logger.debug(f"跳過boss: {boss_name} (持續: {duration_minutes:.1f}分鐘, 不在Bunker 3格範圍內)")
+                            logger.debug(f"跳過boss: {boss_name} (持續: {duration_minutes:.1f}分鐘, 不在Bunker {small_boss_range}格範圍內)")
             
             if not big_bosses and not small_bosses:
                 logger.info("沒有找到符合條件的boss")
@@ -219,37 +314,44 @@ class BossMonitor:
             logger.error(f"獲取boss數據時發生錯誤: {e}")
             return [], []
     
-    def fetch_player_location(self) -> Optional[PlayerLocation]:
-        """獲取角色位置"""
+    def cached_player_location(self) -> Optional[PlayerLocation]:
+        """從位置緩存建立角色位置（含最近的移動記錄），不發出請求"""
+        latest = self.position_cache.latest(self.user_id)
+        if latest is None:
+            return None
+        username, x, y, _ = latest
+        return PlayerLocation(self.user_id, username, x, y, list(self.position_cache.history(self.user_id)))
+    
+    def fetch_player_location(self, force: bool = False) -> Optional[PlayerLocation]:
+        """獲取角色位置（角色靜止時按自適應間隔使用緩存）"""
+        now = self.clock.time()
+        if not force and not self.position_cache.is_due(self.user_id, now):
+            player = self.cached_player_location()
+            logger.info(f"使用緩存的角色位置: {player.username} 在 ({player.x}, {player.y})")
+            return player
+        
         try:
-            timestamp = int(time.time() * 1000)
-            profile_url = f"https://www.dfprofiler.com/profile/json/{self.user_id}?_={timestamp}"
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'application/json, text/javascript, */*; q=0.01',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Referer': 'https://www.dfprofiler.com/bossmap',
-                'X-Requested-With': 'XMLHttpRequest',
-            }
+            timestamp = int(now * 1000)
+            profile_url = f"{self.base_url}/profile/json/{self.user_id}?_={timestamp}"
             
             logger.info(f"正在獲取角色位置: {profile_url}")
-            response = requests.get(profile_url, headers=headers, timeout=30)
-            response.raise_for_status()
+            text = self.transport.get_text(profile_url, headers=REQUEST_HEADERS, timeout=30)
             
-            data = response.json()
+            # 快速路徑：只擷取需要的欄位，找不到時才解碼整份profile
+            fields = extract_profile_location(text)
+            if fields is None:
+                data = json.loads(text)
+                if 'gpscoords' in data and len(data['gpscoords']) >= 2:
+                    fields = (data.get('override', {}).get('account_name', 'Unknown'),
+                              int(data['gpscoords'][0]), int(data['gpscoords'][1]))
+                else:
+                    logger.warning("角色位置數據格式錯誤")
+                    return None
             
-            if 'gpscoords' in data and len(data['gpscoords']) >= 2:
-                x = int(data['gpscoords'][0])
-                y = int(data['gpscoords'][1])
-                username = data.get('override', {}).get('account_name', 'Unknown')
-                
-                player = PlayerLocation(self.user_id, username, x, y)
-                logger.info(f"獲取到角色位置: {username} 在 ({x}, {y})")
-                return player
-            else:
-                logger.warning("角色位置數據格式錯誤")
-                return None
+            username, x, y = fields
+            self.position_cache.record(self.user_id, username, x, y, now)
+            logger.info(f"獲取到角色位置: {username} 在 ({x}, {y})")
+            return self.cached_player_location()
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"獲取角色位置時網絡錯誤: {e}")
@@ -261,172 +363,43 @@ class BossMonitor:
             logger.error(f"獲取角色位置時發生錯誤: {e}")
             return None
     
-    def send_slack_notification(self, message: str, channel: str = SLACK_CHANNEL) -> bool:
-        """發送Slack通知"""
-        try:
-            payload = {
-                "channel": channel,
-                "username": SLACK_USERNAME,
-                "icon_emoji": SLACK_ICON_EMOJI,
-                "text": message
-            }
-            
-            response = requests.post(
-                SLACK_WEBHOOK_URL,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            logger.info("Slack通知發送成功")
-            return True
-            
-        except requests.RequestException as e:
-            logger.error(f"Slack通知發送失敗: {e}")
-            return False
+    def send_notification(self, message, channel: Optional[str] = None) -> bool:
+        """並行發送通知（字串或RenderedMessage）到所有渠道，任一渠道成功即返回True"""
+        results = self.dispatcher.dispatch(message, channel or self.settings.boss_channel)
+        failed = [name for name, success in results.items() if not success]
+        if failed:
+            logger.error(f"以下渠道通知發送失敗: {', '.join(failed)}")
+        return any(results.values())
+    
+    def send_slack_notification(self, message: str, channel: Optional[str] = None) -> bool:
+        """發送通知（保留舊名稱以兼容）"""
+        return self.send_notification(message, channel)
+    
+    def render_boss_message(self, big_bosses: List[BossInfo], small_bosses: List[SmallBossInfo]) -> RenderedMessage:
+        """渲染boss通知（先按boss名稱，再按距離Bunker排序）"""
+        return self.renderer.render_boss_message(big_bosses, small_bosses, self.settings.bunker_location)
     
     def format_boss_message(self, big_bosses: List[BossInfo], small_bosses: List[SmallBossInfo]) -> str:
-        """格式化boss訊息（先按boss名稱，再按距離Bunker排序）"""
-        messages = []
-        bunker_x, bunker_y = 1054, 987
-        
-        # 處理 Big Boss - 1格內的優先排最上
-        if big_bosses:
-            messages.append("=== BIG BOSS ===")
-            # 計算每個Big Boss到Bunker的距離並排序
-            big_boss_with_data = []
-            for boss in big_bosses:
-                boss_x, boss_y = int(boss.location[0]), int(boss.location[1])
-                distance = max(abs(boss_x - bunker_x), abs(boss_y - bunker_y))
-                big_boss_with_data.append((boss.name, distance, boss))
-            
-            # 排序：1格內的優先（distance <= 1），其餘按名稱再按距離
-            big_boss_with_data.sort(key=lambda x: (0 if x[1] <= 1 else 1, x[0], x[1]))
-            
-            for name, distance, boss in big_boss_with_data:
-                # 1格內的boss加醒目emoji
-                if distance <= 1:
-                    boss_str = str(boss)
-                    # 為1格內的boss添加醒目emoji
-                    boss_lines = boss_str.split('\n')
-                    boss_lines[0] = f"🚨 {boss_lines[0]} 🚨"
-                    messages.append('\n'.join(boss_lines))
-                else:
-                    messages.append(str(boss))
-        
-        # 處理 Small Boss - 1格內的優先排最上
-        if small_bosses:
-            if big_bosses:  # 如果有Big Boss，添加分隔線
-                messages.append("")
-            messages.append("=== SMALL BOSS ===")
-            
-            # 計算每個Small Boss到Bunker的距離並排序
-            small_boss_with_data = []
-            for boss in small_bosses:
-                boss_x, boss_y = int(boss.location[0]), int(boss.location[1])
-                distance = max(abs(boss_x - bunker_x), abs(boss_y - bunker_y))
-                small_boss_with_data.append((boss.name, distance, boss))
-            
-            # 排序：1格內的優先（distance <= 1），其餘按名稱再按距離
-            small_boss_with_data.sort(key=lambda x: (0 if x[1] <= 1 else 1, x[0], x[1]))
-            
-            for name, distance, boss in small_boss_with_data:
-                # 1格內的boss加醒目emoji
-                if distance <= 1:
-                    boss_str = str(boss)
-                    # 為1格內的boss添加醒目emoji
-                    boss_lines = boss_str.split('\n')
-                    boss_lines[0] = f"🚨 {boss_lines[0]} 🚨"
-                    messages.append('\n'.join(boss_lines))
-                else:
-                    messages.append(str(boss))
-        
-        return "\n\n".join(messages) if messages else ""
+        """格式化boss訊息為純文字"""
+        return self.render_boss_message(big_bosses, small_bosses).text()
+    
+    def render_location_message(self, player: PlayerLocation, big_bosses: List[BossInfo], nearby_bosses: List) -> RenderedMessage:
+        """渲染位置追蹤訊息（按距離角色排序）"""
+        return self.renderer.render_location_message(player, big_bosses, nearby_bosses, self.settings.bunker_location)
     
     def format_location_tracking_message(self, player: PlayerLocation, big_bosses: List[BossInfo], nearby_bosses: List) -> str:
-        """格式化位置追蹤訊息（按距離角色排序）"""
-        messages = []
-        messages.append(f"📍 **角色位置追蹤** - {player.username}")
-        messages.append(f"當前位置: ({player.x}, {player.y})")
-        messages.append("")
-        
-        # 角色3格範圍內的所有boss - 1格內的優先排最上
-        if nearby_bosses:
-            messages.append("🎯 **角色3格範圍內的Boss**")
-            
-            # 計算每個nearby boss到角色的距離並排序
-            nearby_with_data = []
-            for boss in nearby_bosses:
-                distance, direction = player.calculate_distance_to(boss['location'])
-                nearby_with_data.append((boss['name'], distance, boss, direction))
-            
-            # 排序：1格內的優先（distance <= 1），其餘按名稱再按距離
-            nearby_with_data.sort(key=lambda x: (0 if x[1] <= 1 else 1, x[0], x[1]))
-            
-            for name, distance, boss, direction in nearby_with_data:
-                start_time = boss['start_time'].strftime('%H:%M')
-                end_time = boss['end_time'].strftime('%H:%M')
-                
-                # 1格內的boss加醒目emoji
-                if distance <= 1:
-                    messages.append(f"🚨 • {boss['name']} 在 ({boss['location'][0]}, {boss['location'][1]}) - 距離: {distance}格 ({direction}) 🚨")
-                    messages.append(f"🚨   時間: {start_time} - {end_time} 🚨")
-                else:
-                    messages.append(f"• {boss['name']} 在 ({boss['location'][0]}, {boss['location'][1]}) - 距離: {distance}格 ({direction})")
-                    messages.append(f"  時間: {start_time} - {end_time}")
-            messages.append("")
-        
-        # Big Boss距離 - 1格內的優先排最上
-        if big_bosses:
-            messages.append("🔴 **BIG BOSS 距離**")
-            
-            # 計算每個Big Boss到角色的距離並排序
-            big_boss_with_data = []
-            for boss in big_bosses:
-                distance, direction = player.calculate_distance_to(boss.location)
-                big_boss_with_data.append((boss.name, distance, boss, direction))
-            
-            # 排序：1格內的優先（distance <= 1），其餘按名稱再按距離
-            big_boss_with_data.sort(key=lambda x: (0 if x[1] <= 1 else 1, x[0], x[1]))
-            
-            for name, distance, boss, direction in big_boss_with_data:
-                # 1格內的boss加醒目emoji
-                if distance <= 1:
-                    messages.append(f"🚨 • {boss.name} 在 ({boss.location[0]}, {boss.location[1]}) - 距離: {distance}格 ({direction}) 🚨")
-                else:
-                    messages.append(f"• {boss.name} 在 ({boss.location[0]}, {boss.location[1]}) - 距離: {distance}格 ({direction})")
-            messages.append("")
-        
-        # Bunker距離
-        bunker_distance, bunker_direction = player.calculate_distance_to((1054, 987))
-        messages.append(f"🏠 **Secronom Bunker** - 距離: {bunker_distance}格 ({bunker_direction})")
-        
-        if not nearby_bosses and not big_bosses:
-            messages.append("\n⚠️ 目前沒有符合條件的Boss")
-        
-        return "\n".join(messages)
+        """格式化位置追蹤訊息為純文字"""
+        return self.render_location_message(player, big_bosses, nearby_bosses).text()
     
-    def fetch_nearby_bosses(self, player_location: tuple) -> List:
-        """獲取角色3格範圍內的所有boss"""
+    def fetch_nearby_bosses(self, player_location: tuple, data: Optional[dict] = None) -> List:
+        """獲取角色3格範圍內的所有boss（可傳入已獲取的bossmap數據）"""
         try:
-            # 生成當前時間戳作為URL參數
-            timestamp = int(time.time() * 1000)
-            json_url = f"https://www.dfprofiler.com/bossmap/json/?_={timestamp}"
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'application/json, text/javascript, */*; q=0.01',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Referer': 'https://www.dfprofiler.com/bossmap',
-                'X-Requested-With': 'XMLHttpRequest',
-            }
-
-            response = requests.get(json_url, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            if data is None:
+                data = self.fetch_bossmap_json()
             
             nearby_bosses = []
             player_x, player_y = int(player_location[0]), int(player_location[1])
+            nearby_range = self.settings.nearby_range
 
             # 解析JSON數據，找出角色3格範圍內的所有boss
             for game_id, boss_data in data.items():
@@ -444,7 +417,7 @@ class BossMonitor:
 
                     start_time = datetime.fromtimestamp(start_timestamp)
                     end_time = datetime.fromtimestamp(end_timestamp)
-                    current_time = datetime.now()
+                    current_time = self.clock.now()
 
                     # 跳過已經結束的歷史boss
                     if end_time <= current_time:
@@ -456,7 +429,7 @@ class BossMonitor:
                         boss_x, boss_y = int(location[0]), int(location[1])
                         distance = max(abs(boss_x - player_x), abs(boss_y - player_y))
                         
-                        if distance <= 3:
+                        if distance <= nearby_range:
                             nearby_locations.append(location)
 
                     # 為每個在範圍內的位置創建boss條目
@@ -489,16 +462,23 @@ class BossMonitor:
             logger.error("無法獲取角色位置，跳過本次追蹤")
             return
         
+        # 每個週期只請求一次bossmap
+        try:
+            data = self.fetch_bossmap_json()
+        except Exception as e:
+            logger.error(f"獲取boss數據時發生錯誤: {e}")
+            data = {}
+        
         # 獲取角色3格範圍內的所有boss
-        nearby_bosses = self.fetch_nearby_bosses(player.location)
+        nearby_bosses = self.fetch_nearby_bosses(player.location, data)
         
         # 獲取所有Big Boss（用於距離計算）
-        big_bosses, _ = self.fetch_boss_data()
+        big_bosses, _ = self.fetch_boss_data(data)
         
         # 生成並發送訊息
-        message = self.format_location_tracking_message(player, big_bosses, nearby_bosses)
-        self.send_slack_notification(message, LOCATION_TRACK_CHANNEL)
-        logger.info(f"已發送位置追蹤訊息到 {LOCATION_TRACK_CHANNEL}")
+        message = self.render_location_message(player, big_bosses, nearby_bosses)
+        self.send_notification(message, self.settings.location_channel)
+        logger.info(f"已發送位置追蹤訊息到 {self.settings.location_channel}")
     
     def check_and_notify(self):
         """檢查boss並發送通知"""
@@ -533,16 +513,16 @@ class BossMonitor:
         
         # 發送通知（如果有任何新的boss）
         if new_big_bosses or new_small_bosses:
-            message = self.format_boss_message(new_big_bosses, new_small_bosses)
+            message = self.render_boss_message(new_big_bosses, new_small_bosses)
             if message:
-                self.send_slack_notification(message)
+                self.send_notification(message)
                 logger.info(f"已發送通知: {len(new_big_bosses)} 個Big Boss, {len(new_small_bosses)} 個Small Boss")
         else:
             logger.info("沒有新boss出現")
     
     def cleanup_expired_bosses(self):
         """清理過期的boss"""
-        current_time = datetime.now()
+        current_time = self.clock.now()
         expired_big_boss_keys = []
         expired_small_boss_keys = []
         
@@ -570,46 +550,60 @@ class BossMonitor:
         else:
             logger.info("沒有過期的boss需要清理")
     
-    def run_boss_detection(self):
-        """運行Boss檢測模式"""
-        logger.info("Boss檢測模式啟動")
-        
-        # 設置定時任務
+    def _boss_detection_jobs(self) -> Dict[str, tuple]:
+        return {
+            'check_and_notify': (self.settings.check_interval_minutes, self.check_and_notify),
+            'cleanup_expired_bosses': (self.settings.cleanup_interval_minutes, self.cleanup_expired_bosses),
+        }
+    
+    def _location_tracking_jobs(self) -> Dict[str, tuple]:
+        return {
+            'location_tracking_cycle': (self.settings.location_interval_minutes, self.location_tracking_cycle),
+        }
+    
+    def sync_schedule(self, jobs: Dict[str, tuple]):
+        """按目前設定建立或調整定時任務，間隔未變的任務保留原有排程"""
+        for name, (interval, func) in jobs.items():
+            job = self._jobs.get(name)
+            if job is not None and job.interval == interval:
+                continue
+            if job is not None:
+                schedule.cancel_job(job)
+                logger.info(f"定時任務 {name} 的間隔改為 {interval} 分鐘")
+            self._jobs[name] = schedule.every(interval).minutes.do(func)
+    
+    def _run_scheduled(self, jobs_factory, settings_store: Optional[SettingsStore]):
+        """主循環；設定檔變更時在兩次任務之間套用新設定"""
         schedule.clear()  # 清除之前的任務
-        schedule.every(CHECK_INTERVAL_MINUTES).minutes.do(self.check_and_notify)
-        schedule.every(30).minutes.do(self.cleanup_expired_bosses)  # 每30分鐘清理一次過期boss
-        
-        # 立即執行一次檢查
-        self.check_and_notify()
+        self._jobs = {}
+        self.sync_schedule(jobs_factory())
         
-        # 主循環
         while True:
             try:
+                if settings_store is not None and settings_store.current is not self.settings:
+                    self.apply_settings(settings_store.current)
+                    self.sync_schedule(jobs_factory())
                 schedule.run_pending()
                 time.sleep(1)
             except KeyboardInterrupt:
                 logger.info("收到停止信號，程序退出")
                 break
     
-    def run_location_tracking(self):
+    def run_boss_detection(self, settings_store: Optional[SettingsStore] = None):
+        """運行Boss檢測模式"""
+        logger.info("Boss檢測模式啟動")
+        
+        # 立即執行一次檢查
+        self.check_and_notify()
+        self._run_scheduled(self._boss_detection_jobs, settings_store)
+    
+    def run_location_tracking(self, settings_store: Optional[SettingsStore] = None):
         """運行實時追蹤模式"""
         logger.info("實時追蹤模式啟動")
         
-        # 設置定時任務
-        schedule.clear()  # 清除之前的任務
-        schedule.every(LOCATION_CHECK_INTERVAL_MINUTES).minutes.do(self.location_tracking_cycle)
-        
         # 立即執行一次追蹤
         self.location_tracking_cycle()
-        
-        # 主循環
-        while True:
-            try:
-                schedule.run_pending()
-                time.sleep(1)
-            except KeyboardInterrupt:
-                logger.info("收到停止信號，程序退出")
-                break
+        self._run_scheduled(self._location_tracking_jobs, settings_store)
 
 
 def show_menu():
@@ -620,27 +614,29 @@ def show_menu():
     print("請選擇模式:")
     print("1. Boss 偵測 (每5分鐘檢查，Small Boss範圍: Bunker 3格內)")
     print("2. 實時追蹤 (每分鐘檢查角色與Boss距離)")
-    print("3. 退出")
+    print("3. 多角色追蹤 (所有用戶，多進程分片)")
+    print("4. 退出")
     print("="*50)
 
 
-def select_user():
+def select_user(settings: Settings):
     """選擇用戶"""
     print("\n可用用戶:")
-    users = list(USER_ID_MAPPING.keys())
+    users = list(settings.users.keys())
     for i, user in enumerate(users, 1):
         print(f"{i}. {user}")
     
     while True:
         try:
-            choice = input(f"\n請選擇用戶 (1-{len(users)}, 直接按Enter使用默認tommy660): ").strip()
+            default_name = next((name for name, user_id in settings.users.items() if user_id == settings.default_user_id), "")
+            choice = input(f"\n請選擇用戶 (1-{len(users)}, 直接按Enter使用默認{default_name}): ").strip()
             if not choice:
-                return DEFAULT_USER_ID
+                return settings.default_user_id
             
             choice_num = int(choice)
             if 1 <= choice_num <= len(users):
                 selected_user = users[choice_num - 1]
-                user_id = USER_ID_MAPPING[selected_user]
+                user_id = settings.users[selected_user]
                 print(f"已選擇用戶: {selected_user} (ID: {user_id})")
                 return user_id
             else:
@@ -651,20 +647,31 @@ def select_user():
 
 def main():
     """主程序"""
+    # 監看設定檔，變更會在運行中套用，無需重啟
+    settings_store = SettingsStore()
+    settings_store.start()
+    
     while True:
         show_menu()
-        choice = input("請輸入選擇 (1-3): ").strip()
+        choice = input("請輸入選擇 (1-4): ").strip()
+        settings = settings_store.current
         
         if choice == "1":
-            user_id = select_user()
-            monitor = BossMonitor(user_id)
-            monitor.run_boss_detection()
+            user_id = select_user(settings)
+            monitor = BossMonitor(user_id, settings=settings)
+            monitor.run_boss_detection(settings_store)
         elif choice == "2":
-            user_id = select_user()
-            monitor = BossMonitor(user_id)
-            monitor.run_location_tracking()
+            user_id = select_user(settings)
+            monitor = BossMonitor(user_id, settings=settings)
+            monitor.run_location_tracking(settings_store)
         elif choice == "3":
+            # 延遲導入以避免循環引用
+            from sharded_tracking import ShardedLocationTracker
+            tracker = ShardedLocationTracker(settings.user_ids, settings=settings)
+            tracker.run(settings_store)
+        elif choice == "4":
             print("退出程序...")
+            settings_store.stop()
             break
         else:
             print("無效選擇，請重新輸入")
@@ -0,0 +1,46 @@
+"""
+時鐘抽象
+
+BossMonitor 透過注入的時鐘取得目前時間，正常運行使用 SystemClock，
+回放和測試使用 SimulatedClock 以加速或固定時間。
+"""
+
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    """系統時鐘"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """模擬時鐘，只有在呼叫 set/advance/sleep 時才會前進"""
+
+    def __init__(self, start: float):
+        self._time = float(start)
+
+    def time(self) -> float:
+        return self._time
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._time)
+
+    def set(self, timestamp: float):
+        if timestamp < self._time:
+            raise ValueError("模擬時鐘不能倒退")
+        self._time = float(timestamp)
+
+    def advance(self, seconds: float):
+        self.set(self._time + seconds)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
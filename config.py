@@ -6,9 +6,12 @@ SLACK_ICON_EMOJI = ":slack:"
 
 # 網站配置
 BOSS_MAP_URL = "https://www.dfprofiler.com/bossmap"
+DFPROFILER_BASE_URL = "https://www.dfprofiler.com"
 
 # 檢查間隔（分鐘）
 CHECK_INTERVAL_MINUTES = 5
+# 清理過期boss的間隔（分鐘）
+CLEANUP_INTERVAL_MINUTES = 30
 
 # 用戶ID映射
 USER_ID_MAPPING = {
@@ -27,3 +30,48 @@ DEFAULT_USER_ID = '14008279'
 # 實時追蹤配置
 LOCATION_TRACK_CHANNEL = "#dflocationtrack"
 LOCATION_CHECK_INTERVAL_MINUTES = 1  # 每分鐘檢查一次
+
+# 角色位置緩存：角色靜止時profile輪詢間隔逐步拉長，最長不超過此值（分鐘）
+POSITION_POLL_MAX_INTERVAL_MINUTES = 10
+# 每個角色保留的移動歷史數量
+POSITION_HISTORY_SIZE = 32
+
+# 地圖格子過濾：只通知位於這些格子類型的Small Boss
+# 可選: 'boss-cycle', 'mission', 'qrf', 'outpost', 'devil-hound'；留空表示不過濾
+BOSS_CELL_FILTER = []
+
+# 通知渠道配置（type: slack / discord / email / push）
+# 每個渠道可設定 timeout（秒）、retries、max_concurrency、max_pending
+NOTIFICATION_SINKS = [
+    {
+        'type': 'slack',
+        'name': 'slack',
+        'webhook_url': SLACK_WEBHOOK_URL,
+        'username': SLACK_USERNAME,
+        'icon_emoji': SLACK_ICON_EMOJI,
+        'default_channel': SLACK_CHANNEL,
+        'style': 'text',  # 'text' 或 'blocks'（Slack Block Kit）
+        'timeout': 10,
+        'retries': 2,
+        'max_concurrency': 2,
+    },
+    # {
+    #     'type': 'discord',
+    #     'name': 'discord',
+    #     'channel_webhooks': {
+    #         '#dfbossreminder': 'https://discord.com/api/webhooks/...',
+    #         '#dflocationtrack': 'https://discord.com/api/webhooks/...',
+    #     },
+    # },
+    # {
+    #     'type': 'email',
+    #     'smtp_host': 'smtp.gmail.com',
+    #     'sender': 'bot@example.com',
+    #     'channel_recipients': {'#dfbossreminder': ['me@example.com']},
+    # },
+    # {
+    #     'type': 'push',
+    #     'url': 'https://ntfy.sh/',
+    #     'channel_topics': {'#dfbossreminder': 'dfboss', '#dflocationtrack': 'dflocation'},
+    # },
+]
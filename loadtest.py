@@ -0,0 +1,323 @@
+"""
+負載測試工具
+
+在本機啟動 dfprofiler（bossmap/json、profile/json/<id>）和 Slack webhook 的替身伺服器，
+可設定延遲、錯誤率和限流（429），然後以指定的用戶數驅動位置追蹤流程，
+報告吞吐量、尾延遲、記憶體增長和錯過的週期期限。不會連接任何實際服務。
+
+用法:
+    python loadtest.py --users 100 --duration 120 --interval 10 \\
+        --upstream-latency 5 --upstream-error-rate 0.1 --slack-throttle-rate 0.2
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from boss_monitor import BossMonitor
+from notifiers import NotificationDispatcher, SlackNotifier
+from position_cache import PositionCache
+
+logger = logging.getLogger(__name__)
+
+
+class FaultProfile:
+    """替身伺服器的回應特性"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+
+class StandInServer:
+    """dfprofiler 和 Slack webhook 的本地替身"""
+
+    def __init__(self, upstream: FaultProfile, webhook: FaultProfile, boss_count: int = 50, seed: int = 0):
+        self.upstream = upstream
+        self.webhook = webhook
+        self.boss_count = boss_count
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._positions: Dict[str, List[int]] = {}
+        self.status_counts: Dict[str, Dict[int, int]] = {"bossmap": {}, "profile": {}, "webhook": {}}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path.startswith("/bossmap/json"):
+                    server._respond(self, "bossmap", server.upstream, server.bossmap)
+                elif path.startswith("/profile/json/"):
+                    user_id = path[len("/profile/json/"):].strip("/")
+                    server._respond(self, "profile", server.upstream, lambda: server.profile(user_id))
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.startswith("/webhook"):
+                    server._respond(self, "webhook", server.webhook, lambda: "ok")
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def webhook_url(self) -> str:
+        return f"{self.base_url}/webhook"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def bossmap(self) -> Dict:
+        """以目前時間生成boss資料，位置集中在Bunker附近"""
+        now = int(time.time())
+        data = {}
+        for i in range(self.boss_count):
+            duration = 7200 if i % 5 == 0 else 1800
+            data[str(i)] = {
+                "special_enemy_type": f"Boss {i % 12}",
+                "start_time": now - 600,
+                "end_time": now + duration - 600,
+                "locations": [[1040 + (i * 7) % 30, 975 + (i * 11) % 25], [1054 + i % 3, 987 - i % 3]],
+            }
+        return data
+
+    def profile(self, user_id: str) -> Dict:
+        """每次請求角色隨機移動一步"""
+        with self._lock:
+            position = self._positions.setdefault(user_id, [1054, 987])
+            position[0] += self._random.choice((-1, 0, 1))
+            position[1] += self._random.choice((-1, 0, 1))
+            x, y = position
+        return {"gpscoords": [x, y], "override": {"account_name": f"user{user_id}"}}
+
+    def _respond(self, handler: BaseHTTPRequestHandler, route: str, profile: FaultProfile, body_factory):
+        delay = profile.latency + (self._random.uniform(0, profile.jitter) if profile.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        roll = self._random.random()
+        if roll < profile.throttle_rate:
+            status, body = 429, b"rate_limited"
+        elif roll < profile.throttle_rate + profile.error_rate:
+            status, body = 500, b"error"
+        else:
+            result = body_factory()
+            status, body = 200, (result if isinstance(result, str) else json.dumps(result)).encode("utf-8")
+
+        with self._lock:
+            counts = self.status_counts[route]
+            counts[status] = counts.get(status, 0) + 1
+
+        handler.send_response(status)
+        if status == 429:
+            handler.send_header("Retry-After", str(profile.retry_after))
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LoadTestReport:
+    """負載測試結果"""
+
+    def __init__(self, users: int, elapsed: float, ticks: int, cycle_latencies: List[float],
+                 tick_latencies: List[float], missed_ticks: int, missed_cycles: int,
+                 memory_start: int, memory_end: int, memory_peak: int,
+                 status_counts: Dict[str, Dict[int, int]]):
+        self.users = users
+        self.elapsed = elapsed
+        self.ticks = ticks
+        self.cycle_latencies = cycle_latencies
+        self.tick_latencies = tick_latencies
+        self.missed_ticks = missed_ticks
+        self.missed_cycles = missed_cycles
+        self.memory_start = memory_start
+        self.memory_end = memory_end
+        self.memory_peak = memory_peak
+        self.status_counts = status_counts
+
+    @property
+    def throughput(self) -> float:
+        """每秒完成的用戶追蹤週期"""
+        return self.users * self.ticks / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        lines = [
+            f"用戶數: {self.users}, 週期數: {self.ticks}, 耗時: {self.elapsed:.1f} 秒",
+            f"吞吐量: {self.throughput:.1f} 用戶週期/秒",
+        ]
+        for label, values in (("單用戶週期延遲", self.cycle_latencies), ("整體週期延遲", self.tick_latencies)):
+            if values:
+                lines.append(f"{label}: p50 {percentile(values, 0.5):.2f}s, p95 {percentile(values, 0.95):.2f}s, "
+                             f"p99 {percentile(values, 0.99):.2f}s, 最大 {max(values):.2f}s")
+        missed = f"錯過期限: {self.missed_ticks} 個整體週期"
+        if self.cycle_latencies:
+            missed += f", {self.missed_cycles} 個用戶週期"
+        lines.append(missed)
+        lines.append(f"記憶體: 首週期後 {self.memory_start / 1024:.0f} KiB, 結束 {self.memory_end / 1024:.0f} KiB "
+                     f"(增長 {(self.memory_end - self.memory_start) / 1024:.0f} KiB), 峰值 {self.memory_peak / 1024:.0f} KiB")
+        for route, counts in self.status_counts.items():
+            lines.append(f"{route} 回應: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())))
+        return "\n".join(lines)
+
+
+class LoadTest:
+    """以指定用戶數驅動位置追蹤流程"""
+
+    def __init__(self, server: StandInServer, users: int, interval: float, mode: str = "threads",
+                 io_workers: int = 32, shard_workers: Optional[int] = None,
+                 sink_timeout: float = 10, sink_retries: int = 2, sink_concurrency: int = 4):
+        self.server = server
+        self.users = users
+        self.interval = interval
+        self.mode = mode
+        user_ids = [str(20000000 + i) for i in range(users)]
+
+        sink = SlackNotifier("slack", server.webhook_url, timeout=sink_timeout, retries=sink_retries,
+                             max_concurrency=sink_concurrency, max_pending=max(20, users * 2), retry_backoff=0.5)
+        self.dispatcher = NotificationDispatcher([sink])
+        # 位置緩存的最短輪詢間隔跟隨測試週期
+        self.position_cache = PositionCache(min_interval=interval, max_interval=interval * 10)
+
+        if mode == "sharded":
+            from sharded_tracking import ShardedLocationTracker
+            self.tracker = ShardedLocationTracker(user_ids, num_workers=shard_workers, dispatcher=self.dispatcher,
+                                                  io_workers=io_workers, base_url=server.base_url,
+                                                  position_cache=self.position_cache)
+        else:
+            self.monitors = [BossMonitor(user_id, dispatcher=self.dispatcher, base_url=server.base_url,
+                                         position_cache=self.position_cache)
+                             for user_id in user_ids]
+            self._pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="loadtest")
+
+    def _timed_cycle(self, monitor: BossMonitor) -> float:
+        started = time.monotonic()
+        monitor.location_tracking_cycle()
+        return time.monotonic() - started
+
+    def run_tick(self) -> List[float]:
+        """
+        執行一個週期，返回每個用戶的週期耗時
+        分片模式下為由週期開始到該用戶訊息發送完成的時間（包含共用的bossmap請求和快照發布）
+        """
+        if self.mode == "sharded":
+            return list(self.tracker.tracking_cycle().values())
+        return list(self._pool.map(self._timed_cycle, self.monitors))
+
+    def run(self, duration: float) -> LoadTestReport:
+        tracemalloc.start()
+        memory_start = 0
+        cycle_latencies: List[float] = []
+        tick_latencies: List[float] = []
+        missed_ticks = 0
+
+        started = time.monotonic()
+        next_tick = started
+        ticks = 0
+        while time.monotonic() - started < duration:
+            tick_started = time.monotonic()
+            cycle_latencies.extend(self.run_tick())
+            tick_latency = time.monotonic() - tick_started
+            tick_latencies.append(tick_latency)
+            ticks += 1
+            if ticks == 1:
+                # 以第一個週期之後的記憶體為基準，排除連線和模組的一次性分配
+                memory_start = tracemalloc.get_traced_memory()[0]
+            if tick_latency > self.interval:
+                missed_ticks += 1
+
+            next_tick += self.interval
+            wait = next_tick - time.monotonic()
+            if wait > 0:
+                time.sleep(min(wait, max(0.0, duration - (time.monotonic() - started))))
+            else:
+                # 落後時從現在重新計算下一個週期
+                next_tick = time.monotonic()
+        elapsed = time.monotonic() - started
+
+        memory_end, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        missed_cycles = sum(1 for latency in cycle_latencies if latency > self.interval)
+        return LoadTestReport(self.users, elapsed, ticks, cycle_latencies, tick_latencies, missed_ticks,
+                              missed_cycles, memory_start, memory_end, memory_peak, self.server.status_counts)
+
+    def close(self):
+        if self.mode == "sharded":
+            self.tracker.close()
+        else:
+            self._pool.shutdown(wait=True)
+        self.dispatcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Boss監控負載測試")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60, help="測試時長（秒）")
+    parser.add_argument("--interval", type=float, default=60, help="追蹤週期（秒）")
+    parser.add_argument("--mode", choices=("threads", "sharded"), default="threads")
+    parser.add_argument("--io-workers", type=int, default=32)
+    parser.add_argument("--shard-workers", type=int, default=None)
+    parser.add_argument("--bosses", type=int, default=50)
+    parser.add_argument("--upstream-latency", type=float, default=0.0)
+    parser.add_argument("--upstream-jitter", type=float, default=0.0)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--slack-latency", type=float, default=0.0)
+    parser.add_argument("--slack-error-rate", type=float, default=0.0)
+    parser.add_argument("--slack-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--slack-retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    server = StandInServer(
+        FaultProfile(args.upstream_latency, args.upstream_jitter, args.upstream_error_rate, args.upstream_throttle_rate),
+        FaultProfile(args.slack_latency, 0.0, args.slack_error_rate, args.slack_throttle_rate, args.slack_retry_after),
+        boss_count=args.bosses,
+    ).start()
+    load_test = LoadTest(server, args.users, args.interval, mode=args.mode,
+                         io_workers=args.io_workers, shard_workers=args.shard_workers)
+    try:
+        print(load_test.run(args.duration).summary())
+    finally:
+        load_test.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
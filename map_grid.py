@@ -0,0 +1,250 @@
+"""
+靜態地圖格子
+
+把 dfboss_reminder_flutter/boss_map.html 的座標表格預先編譯成緊湊的二進位檔
+（map_grid.bin），載入時以 mmap 直接讀取，任意座標的格子資訊都是常數時間查詢。
+
+編譯: python map_grid.py [boss_map.html] [map_grid.bin]
+
+檔案佈局（little-endian）:
+    header : magic(4s) version(H) min_x(H) min_y(H) width(H) height(H) meta_length(I)
+    cells  : width * height 個格子，每格 CELL_FIELDS 個 uint16
+             (flags, key, title, label, nearest_landmark)，按 (y, x) 行優先排列
+    meta   : UTF-8 JSON {"strings": [...], "landmarks": [[x, y, title], ...]}
+             title / label 為 strings 的索引，nearest_landmark 為 landmarks 的索引
+"""
+
+import html
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+MAGIC = b'DFMG'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHHI')
+CELL_FIELDS = 5
+NO_INDEX = 0xFFFF
+
+DEFAULT_HTML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dfboss_reminder_flutter', 'boss_map.html')
+DEFAULT_MAP_GRID_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'map_grid.bin')
+
+# 格子類型旗標
+FLAG_BOSS_CYCLE = 1 << 0
+FLAG_MISSION = 1 << 1
+FLAG_QRF = 1 << 2
+FLAG_OUTPOST = 1 << 3
+FLAG_DEVIL_HOUND = 1 << 4
+
+# HTML class 名稱 -> 旗標
+CLASS_FLAGS = {
+    'boss-cycle': FLAG_BOSS_CYCLE,
+    'mission': FLAG_MISSION,
+    'qrf': FLAG_QRF,
+    'secronomBunker': FLAG_OUTPOST,
+    'dhIC': FLAG_DEVIL_HOUND,
+}
+
+# 配置中使用的名稱 -> 旗標
+FLAG_NAMES = {
+    'boss-cycle': FLAG_BOSS_CYCLE,
+    'mission': FLAG_MISSION,
+    'qrf': FLAG_QRF,
+    'outpost': FLAG_OUTPOST,
+    'devil-hound': FLAG_DEVIL_HOUND,
+}
+
+# 作為「地標」的格子類型（只有前哨站；QRF等是boss出生格，不是地標）
+LANDMARK_FLAGS = FLAG_OUTPOST
+
+_CELL_PATTERN = re.compile(r'<td class="coord x(\d+) y(\d+)([^"]*)"([^>]*)>(.*?)</td>', re.S)
+_TITLE_PATTERN = re.compile(r'data-title="([^"]*)"')
+_KEY_PATTERN = re.compile(r'data-key="(\d+)"')
+_LABEL_PATTERN = re.compile(r'<span>(.*?)</span>', re.S)
+
+
+def flag_names(flags: int) -> List[str]:
+    """旗標轉換為名稱列表"""
+    return [name for name, flag in FLAG_NAMES.items() if flags & flag]
+
+
+def parse_flag_names(names: List[str]) -> int:
+    """名稱列表轉換為旗標"""
+    flags = 0
+    for name in names:
+        if name not in FLAG_NAMES:
+            raise ValueError(f"未知的格子類型: {name}")
+        flags |= FLAG_NAMES[name]
+    return flags
+
+
+class CellInfo:
+    """單個地圖格子的資訊"""
+    def __init__(self, x: int, y: int, flags: int, key: int, title: str, label: str):
+        self.x = x
+        self.y = y
+        self.flags = flags
+        self.key = key
+        self.title = title
+        self.label = label
+
+    def has_flag(self, flag: int) -> bool:
+        return bool(self.flags & flag)
+
+    def __str__(self):
+        parts = [part for part in (self.label, self.title) if part]
+        return " ".join(parts) if parts else f"({self.x}, {self.y})"
+
+
+def parse_boss_map_html(text: str) -> List[Tuple[int, int, int, int, str, str]]:
+    """解析HTML表格，返回 [(x, y, flags, key, title, label), ...]"""
+    cells = []
+    for match in _CELL_PATTERN.finditer(text):
+        x, y = int(match.group(1)), int(match.group(2))
+        flags = 0
+        for class_name in match.group(3).split():
+            flags |= CLASS_FLAGS.get(class_name, 0)
+
+        attributes = match.group(4)
+        title_match = _TITLE_PATTERN.search(attributes)
+        key_match = _KEY_PATTERN.search(attributes)
+        label_match = _LABEL_PATTERN.search(match.group(5))
+
+        title = html.unescape(title_match.group(1)) if title_match else ""
+        key = int(key_match.group(1)) if key_match else 0
+        label = html.unescape(label_match.group(1).strip()) if label_match else ""
+        cells.append((x, y, flags, key, title, label))
+    return cells
+
+
+def compile_map_grid(html_path: str = DEFAULT_HTML_PATH, output_path: str = DEFAULT_MAP_GRID_PATH) -> str:
+    """將boss_map.html編譯成map_grid.bin"""
+    with open(html_path, encoding='utf-8') as f:
+        cells = parse_boss_map_html(f.read())
+    if not cells:
+        raise ValueError(f"{html_path} 中找不到座標格子")
+
+    min_x = min(cell[0] for cell in cells)
+    min_y = min(cell[1] for cell in cells)
+    width = max(cell[0] for cell in cells) - min_x + 1
+    height = max(cell[1] for cell in cells) - min_y + 1
+
+    strings = [""]
+    string_index = {"": 0}
+
+    def intern(value: str) -> int:
+        if value not in string_index:
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    grid = [0, 0, 0, 0, NO_INDEX] * (width * height)
+    landmarks = []
+    for x, y, flags, key, title, label in cells:
+        base = ((y - min_y) * width + (x - min_x)) * CELL_FIELDS
+        grid[base:base + 4] = [flags, key, intern(title), intern(label)]
+        if flags & LANDMARK_FLAGS:
+            landmarks.append([x, y, intern(title)])
+
+    # 預先計算每格最近的地標，查詢時不需要掃描
+    if landmarks:
+        for row in range(height):
+            for column in range(width):
+                x, y = min_x + column, min_y + row
+                nearest = min(range(len(landmarks)),
+                              key=lambda i: max(abs(landmarks[i][0] - x), abs(landmarks[i][1] - y)))
+                grid[(row * width + column) * CELL_FIELDS + 4] = nearest
+
+    meta = json.dumps({"strings": strings, "landmarks": landmarks}, ensure_ascii=False).encode('utf-8')
+    with open(output_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, min_x, min_y, width, height, len(meta)))
+        f.write(struct.pack(f'<{len(grid)}H', *grid))
+        f.write(meta)
+    return output_path
+
+
+class MapGrid:
+    """以mmap載入的地圖格子，所有查詢為常數時間"""
+
+    def __init__(self, path: str = DEFAULT_MAP_GRID_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.min_x, self.min_y, self.width, self.height, meta_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} 不是有效的地圖格子檔案")
+
+        cells_end = HEADER.size + self.width * self.height * CELL_FIELDS * 2
+        self._cells = memoryview(self._mmap)[HEADER.size:cells_end].cast('H')
+        meta = json.loads(self._mmap[cells_end:cells_end + meta_length].decode('utf-8'))
+        self._strings = meta["strings"]
+        self.landmarks = [(x, y, self._strings[title]) for x, y, title in meta["landmarks"]]
+
+    def _base(self, x: int, y: int) -> int:
+        column = int(x) - self.min_x
+        row = int(y) - self.min_y
+        if 0 <= column < self.width and 0 <= row < self.height:
+            return (row * self.width + column) * CELL_FIELDS
+        return -1
+
+    def contains(self, x: int, y: int) -> bool:
+        return self._base(x, y) >= 0
+
+    def flags_at(self, x: int, y: int) -> int:
+        """格子的類型旗標，地圖外返回0"""
+        base = self._base(x, y)
+        return self._cells[base] if base >= 0 else 0
+
+    def has_flag(self, x: int, y: int, flag: int) -> bool:
+        return bool(self.flags_at(x, y) & flag)
+
+    def cell_at(self, x: int, y: int) -> Optional[CellInfo]:
+        """格子的完整資訊，地圖外返回None"""
+        base = self._base(x, y)
+        if base < 0:
+            return None
+        cells = self._cells
+        return CellInfo(int(x), int(y), cells[base], cells[base + 1],
+                        self._strings[cells[base + 2]], self._strings[cells[base + 3]])
+
+    def nearest_landmark(self, x: int, y: int) -> Optional[Tuple[str, int, int, int]]:
+        """最近的地標，返回 (名稱, x, y, 距離)"""
+        base = self._base(x, y)
+        if base < 0 or self._cells[base + 4] == NO_INDEX:
+            return None
+        landmark_x, landmark_y, title = self.landmarks[self._cells[base + 4]]
+        return title, landmark_x, landmark_y, max(abs(landmark_x - int(x)), abs(landmark_y - int(y)))
+
+    def cells_with(self, flag: int) -> Iterator[CellInfo]:
+        """列出所有帶有指定旗標的格子"""
+        for row in range(self.height):
+            for column in range(self.width):
+                if self._cells[(row * self.width + column) * CELL_FIELDS] & flag:
+                    yield self.cell_at(self.min_x + column, self.min_y + row)
+
+    def close(self):
+        self._cells.release()
+        self._mmap.close()
+
+
+@lru_cache(maxsize=None)
+def load_map_grid(path: str = DEFAULT_MAP_GRID_PATH) -> Optional[MapGrid]:
+    """載入地圖格子（同一路徑只載入一次）；檔案不存在時返回None"""
+    if not os.path.exists(path):
+        return None
+    return MapGrid(path)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_HTML_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_MAP_GRID_PATH
+    compile_map_grid(source, target)
+    grid = MapGrid(target)
+    print(f"已編譯 {grid.width}x{grid.height} 地圖格子 ({len(grid.landmarks)} 個地標) -> {target}")
+    grid.close()
@@ -0,0 +1,347 @@
+"""
+通知渠道（sink）模組
+
+每個渠道有自己的格式化、超時、重試和並發限制，
+NotificationDispatcher 會並行地把同一則訊息派發到所有渠道，
+一個渠道緩慢或失效不會拖慢其他渠道。
+"""
+
+import logging
+import re
+import smtplib
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+import requests
+
+from rendering import SLACK_TEXT_LIMIT, as_rendered
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier(ABC):
+    """通知渠道基底類別（子類別必須實作 deliver）"""
+
+    sink_type = "base"
+
+    def __init__(self, name: str, timeout: float = 10, retries: int = 2, max_concurrency: int = 1,
+                 max_pending: int = 20, retry_backoff: float = 1.0):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.max_concurrency = max_concurrency
+        self.retry_backoff = retry_backoff
+        # 每個渠道有獨立的線程池，失效的渠道只會佔用自己的線程
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"notifier-{name}")
+        # 限制排隊中的訊息數量，避免失效渠道無限堆積
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    @property
+    def deadline(self) -> float:
+        """單個部分（包括所有重試）的最長發送時間（秒）"""
+        backoff = sum(self.retry_backoff * (2 ** i) for i in range(self.retries))
+        return self.timeout * (self.retries + 1) + backoff
+
+    def deadline_for(self, rendered) -> float:
+        """發送整則格式化結果的最長等待時間（秒）"""
+        return self.deadline * len(self.split(rendered))
+
+    @property
+    def render_key(self):
+        """格式化結果相同的渠道共用同一個key"""
+        return type(self)
+
+    def render(self, message):
+        """將訊息（字串或RenderedMessage）轉換為此渠道類型的內容（同類型渠道共用一次結果）"""
+        return str(message)
+
+    def split(self, rendered) -> list:
+        """把格式化結果拆成依序發送的部分（預設為一個部分）"""
+        return [rendered]
+
+    @abstractmethod
+    def deliver(self, rendered, channel: Optional[str]) -> None:
+        """實際發送一個部分一次，失敗時拋出異常"""
+
+    def send(self, rendered, channel: Optional[str] = None) -> bool:
+        """同步發送；每個部分各自重試，已送達的部分不會重發"""
+        parts = self.split(rendered)
+        for index, part in enumerate(parts):
+            if not self._send_part(part, channel):
+                if index:
+                    logger.error(f"[{self.name}] 已送達 {index}/{len(parts)} 個部分，其餘部分放棄發送")
+                return False
+        logger.info(f"[{self.name}] 通知發送成功")
+        return True
+
+    def _send_part(self, part, channel: Optional[str]) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                self.deliver(part, channel)
+                return True
+            except Exception as e:
+                logger.error(f"[{self.name}] 通知發送失敗 (第{attempt + 1}次): {e}")
+                if attempt < self.retries:
+                    time.sleep(self._retry_delay(e, attempt))
+        return False
+
+    def submit(self, rendered, channel: Optional[str] = None) -> Future:
+        """在此渠道自己的線程池中非同步發送"""
+        if not self._pending.acquire(blocking=False):
+            logger.warning(f"[{self.name}] 待發送訊息過多，丟棄本次通知")
+            future = Future()
+            future.set_result(False)
+            return future
+
+        def task():
+            try:
+                return self.send(rendered, channel)
+            finally:
+                self._pending.release()
+
+        return self._executor.submit(task)
+
+    def close(self, cancel_pending: bool = True):
+        """關閉渠道線程池（不等待未完成的發送）；cancel_pending=False 時排隊中的訊息仍會發出"""
+        self._executor.shutdown(wait=False, cancel_futures=cancel_pending)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """計算重試等待時間，遇到429時遵循Retry-After"""
+        delay = self.retry_backoff * (2 ** attempt)
+        response = getattr(error, 'response', None)
+        if response is not None and response.status_code == 429:
+            try:
+                delay = max(delay, float(response.headers.get('Retry-After', 0)))
+            except ValueError:
+                pass
+        return min(delay, self.timeout)
+
+
+class SlackNotifier(Notifier):
+    """Slack Incoming Webhook 渠道"""
+
+    sink_type = "slack"
+
+    def __init__(self, name: str, webhook_url: str, username: str = "Bot", icon_emoji: str = ":slack:",
+                 default_channel: Optional[str] = None, style: str = "text", **kwargs):
+        super().__init__(name, **kwargs)
+        if style not in ("text", "blocks"):
+            raise ValueError(f"未知的Slack訊息樣式: {style}")
+        self.webhook_url = webhook_url
+        self.username = username
+        self.icon_emoji = icon_emoji
+        self.default_channel = default_channel
+        self.style = style
+
+    @property
+    def render_key(self):
+        return type(self), self.style
+
+    def render(self, message):
+        """按Slack限制切分為多段，返回 [(text, blocks), ...]"""
+        rendered = as_rendered(message)
+        if self.style == "blocks":
+            return rendered.block_chunks()
+        return [(chunk, None) for chunk in rendered.text_chunks(SLACK_TEXT_LIMIT)]
+
+    def split(self, rendered) -> list:
+        return rendered
+
+    def deliver(self, rendered, channel: Optional[str]) -> None:
+        text, blocks = rendered
+        payload = {
+            "username": self.username,
+            "icon_emoji": self.icon_emoji,
+            "text": text
+        }
+        if blocks:
+            payload["blocks"] = blocks
+        if channel or self.default_channel:
+            payload["channel"] = channel or self.default_channel
+
+        response = requests.post(self.webhook_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class DiscordNotifier(Notifier):
+    """Discord Webhook 渠道（每個頻道對應一個webhook URL）"""
+
+    sink_type = "discord"
+    MAX_CONTENT_LENGTH = 2000
+
+    def __init__(self, name: str, webhook_url: Optional[str] = None, channel_webhooks: Optional[Dict[str, str]] = None,
+                 username: str = "Bot", **kwargs):
+        super().__init__(name, **kwargs)
+        self.webhook_url = webhook_url
+        self.channel_webhooks = channel_webhooks or {}
+        self.username = username
+
+    def render(self, message):
+        """切分為不超過Discord長度限制的多段內容"""
+        return as_rendered(message).text_chunks(self.MAX_CONTENT_LENGTH)
+
+    def split(self, rendered) -> list:
+        return rendered
+
+    def deliver(self, rendered, channel: Optional[str]) -> None:
+        url = self.channel_webhooks.get(channel, self.webhook_url)
+        if not url:
+            logger.debug(f"[{self.name}] 頻道 {channel} 沒有對應的Discord webhook，略過")
+            return
+        response = requests.post(url, json={"username": self.username, "content": rendered}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class EmailNotifier(Notifier):
+    """SMTP 電郵渠道"""
+
+    sink_type = "email"
+
+    def __init__(self, name: str, smtp_host: str, sender: str, recipients: Optional[List[str]] = None,
+                 channel_recipients: Optional[Dict[str, List[str]]] = None, smtp_port: int = 587,
+                 username: Optional[str] = None, password: Optional[str] = None, use_tls: bool = True,
+                 subject_prefix: str = "[DF Boss]", **kwargs):
+        super().__init__(name, **kwargs)
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.sender = sender
+        self.recipients = recipients or []
+        self.channel_recipients = channel_recipients or {}
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.subject_prefix = subject_prefix
+
+    def render(self, message):
+        """返回 (主旨, 純文字內容)"""
+        body = str(message).replace("**", "")
+        first_line = next((line for line in body.split("\n") if line.strip()), "")
+        return f"{self.subject_prefix} {first_line.strip()}", body
+
+    def deliver(self, rendered, channel: Optional[str]) -> None:
+        recipients = self.channel_recipients.get(channel, self.recipients)
+        if not recipients:
+            logger.debug(f"[{self.name}] 頻道 {channel} 沒有收件人，略過")
+            return
+
+        subject, body = rendered
+        email = EmailMessage()
+        email["Subject"] = subject
+        email["From"] = self.sender
+        email["To"] = ", ".join(recipients)
+        email.set_content(body)
+
+        with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(email)
+
+
+class PushNotifier(Notifier):
+    """桌面/手機推送橋接渠道（以JSON POST到推送服務）"""
+
+    sink_type = "push"
+    _EMOJI_PATTERN = re.compile(r"[\U0001F300-\U0001FAFF☀-➿]\s?")
+
+    def __init__(self, name: str, url: str, channel_topics: Optional[Dict[str, str]] = None,
+                 headers: Optional[Dict[str, str]] = None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.url = url
+        self.channel_topics = channel_topics or {}
+        self.headers = headers or {}
+
+    def render(self, message):
+        """推送通知只需要簡短的標題和純文字內容"""
+        text = self._EMOJI_PATTERN.sub("", str(message).replace("**", ""))
+        lines = [line for line in text.split("\n") if line.strip()]
+        title = lines[0].strip() if lines else ""
+        return {"title": title, "message": "\n".join(lines[1:])}
+
+    def deliver(self, rendered, channel: Optional[str]) -> None:
+        payload = dict(rendered)
+        payload["topic"] = self.channel_topics.get(channel, channel)
+        response = requests.post(self.url, json=payload, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+NOTIFIER_TYPES = {
+    SlackNotifier.sink_type: SlackNotifier,
+    DiscordNotifier.sink_type: DiscordNotifier,
+    EmailNotifier.sink_type: EmailNotifier,
+    PushNotifier.sink_type: PushNotifier,
+}
+
+
+def build_notifiers(sink_configs: List[Dict]) -> List[Notifier]:
+    """根據配置建立通知渠道列表"""
+    notifiers = []
+    for sink_config in sink_configs:
+        options = dict(sink_config)
+        sink_type = options.pop('type')
+        if sink_type not in NOTIFIER_TYPES:
+            raise ValueError(f"未知的通知渠道類型: {sink_type}")
+        options.setdefault('name', sink_type)
+        notifiers.append(NOTIFIER_TYPES[sink_type](**options))
+    return notifiers
+
+
+class NotificationDispatcher:
+    """將訊息並行派發到所有通知渠道"""
+
+    def __init__(self, notifiers: List[Notifier]):
+        self.notifiers = list(notifiers)
+
+    def dispatch(self, message, channel: Optional[str] = None, wait: bool = True) -> Dict[str, bool]:
+        """
+        派發訊息（字串或RenderedMessage）到所有渠道
+        返回: {渠道名稱: 是否成功}；wait=False 時立即返回空字典
+        """
+        # 同一類型的渠道只格式化一次；格式化失敗只影響該類型的渠道
+        rendered_by_type = {}
+        failed_keys = set()
+        futures = []
+        results = {}
+        for notifier in self.notifiers:  # 讀取一次列表，替換渠道時不受影響
+            render_key = notifier.render_key
+            if render_key not in rendered_by_type and render_key not in failed_keys:
+                try:
+                    rendered_by_type[render_key] = notifier.render(message)
+                except Exception as e:
+                    logger.error(f"[{notifier.name}] 通知格式化失敗: {e}")
+                    failed_keys.add(render_key)
+            if render_key in failed_keys:
+                results[notifier.name] = False
+                continue
+            futures.append((notifier, notifier.submit(rendered_by_type[render_key], channel)))
+
+        if not wait:
+            return {}
+
+        # 所有渠道同時在運行，依序等待只會受最慢渠道自己的期限限制
+        started = time.monotonic()
+        for notifier, future in futures:
+            deadline = notifier.deadline_for(rendered_by_type[notifier.render_key])
+            remaining = max(0.0, deadline - (time.monotonic() - started))
+            try:
+                results[notifier.name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                logger.error(f"[{notifier.name}] 通知發送超時 ({deadline:.0f}秒)")
+                results[notifier.name] = False
+        return results
+
+    def replace_notifiers(self, notifiers: List[Notifier]):
+        """以新的渠道列表替換現有渠道；舊渠道中排隊的訊息會繼續發送完畢"""
+        previous, self.notifiers = self.notifiers, list(notifiers)
+        for notifier in previous:
+            notifier.close(cancel_pending=False)
+
+    def close(self):
+        """關閉所有渠道"""
+        for notifier in self.notifiers:
+            notifier.close()
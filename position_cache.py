@@ -0,0 +1,144 @@
+"""
+角色位置緩存
+
+每個用戶保存一個固定大小的移動歷史環形緩衝區 (timestamp, x, y)，
+並根據是否移動自適應調整 profile 輪詢間隔：靜止時逐步拉長，移動時立即恢復最短間隔。
+另提供只擷取 gpscoords / account_name 的快速解析，避免解碼整份 profile JSON。
+"""
+
+import json
+import re
+import threading
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+_GPS_PATTERN = re.compile(r'"gpscoords"\s*:\s*\[\s*"?(-?\d+)"?\s*,\s*"?(-?\d+)"?')
+_ACCOUNT_NAME_PATTERN = re.compile(r'"override"\s*:\s*\{[^{}]*?"account_name"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def extract_profile_location(text: str) -> Optional[Tuple[str, int, int]]:
+    """
+    從profile原始JSON文字中直接擷取 (account_name, x, y)
+    找不到欄位時返回None，由呼叫者改用完整JSON解析
+    """
+    gps_match = _GPS_PATTERN.search(text)
+    name_match = _ACCOUNT_NAME_PATTERN.search(text)
+    if not gps_match or not name_match:
+        return None
+    username = json.loads(f'"{name_match.group(1)}"')
+    return username, int(gps_match.group(1)), int(gps_match.group(2))
+
+
+class PositionHistory:
+    """固定大小的位置環形緩衝區"""
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self._times = array('d', [0.0]) * capacity
+        self._xs = array('i', [0]) * capacity
+        self._ys = array('i', [0]) * capacity
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def resized(self, capacity: int) -> "PositionHistory":
+        """建立指定容量的副本，保留最新的記錄"""
+        history = PositionHistory(capacity)
+        for timestamp, x, y in list(self)[-capacity:]:
+            history.append(timestamp, x, y)
+        return history
+
+    def append(self, timestamp: float, x: int, y: int):
+        self._times[self._next] = timestamp
+        self._xs[self._next] = x
+        self._ys[self._next] = y
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def __iter__(self) -> Iterator[Tuple[float, int, int]]:
+        """由舊到新"""
+        start = (self._next - self._count) % self.capacity
+        for i in range(self._count):
+            index = (start + i) % self.capacity
+            yield self._times[index], self._xs[index], self._ys[index]
+
+    def latest(self) -> Optional[Tuple[float, int, int]]:
+        if not self._count:
+            return None
+        index = (self._next - 1) % self.capacity
+        return self._times[index], self._xs[index], self._ys[index]
+
+
+class _CacheEntry:
+    """單一用戶的緩存狀態"""
+    def __init__(self, capacity: int, interval: float):
+        self.history = PositionHistory(capacity)
+        self.username = ""
+        self.interval = interval
+        self.next_poll_at = 0.0
+
+
+class PositionCache:
+    """按用戶的位置緩存與自適應輪詢"""
+
+    def __init__(self, min_interval: float = 60, max_interval: float = 600, backoff: float = 2.0,
+                 capacity: int = 32):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.capacity = capacity
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, user_id: str) -> _CacheEntry:
+        with self._lock:
+            if user_id not in self._entries:
+                self._entries[user_id] = _CacheEntry(self.capacity, self.min_interval)
+            return self._entries[user_id]
+
+    def is_due(self, user_id: str, now: float) -> bool:
+        """是否需要重新請求profile（容許10%最短間隔的排程誤差）"""
+        entry = self._entries.get(user_id)
+        if entry is None or not len(entry.history):
+            return True
+        return now + self.min_interval * 0.1 >= entry.next_poll_at
+
+    def record(self, user_id: str, username: str, x: int, y: int, now: float):
+        """記錄新位置並調整下次輪詢時間"""
+        entry = self._entry(user_id)
+        latest = entry.history.latest()
+        if latest is not None and (latest[1], latest[2]) == (x, y):
+            entry.interval = min(entry.interval * self.backoff, self.max_interval)
+        else:
+            entry.interval = self.min_interval
+        entry.username = username
+        entry.history.append(now, x, y)
+        entry.next_poll_at = now + entry.interval
+
+    def latest(self, user_id: str) -> Optional[Tuple[str, int, int, float]]:
+        """最近的位置 (username, x, y, timestamp)"""
+        entry = self._entries.get(user_id)
+        if entry is None or not len(entry.history):
+            return None
+        timestamp, x, y = entry.history.latest()
+        return entry.username, x, y, timestamp
+
+    def resize(self, capacity: int):
+        """調整每個用戶保留的歷史數量；現有歷史保留最新的記錄"""
+        with self._lock:
+            if capacity == self.capacity:
+                return
+            self.capacity = capacity
+            for entry in self._entries.values():
+                entry.history = entry.history.resized(capacity)
+
+    def history(self, user_id: str) -> Optional[PositionHistory]:
+        entry = self._entries.get(user_id)
+        return entry.history if entry else None
+
+    def interval(self, user_id: str) -> float:
+        """用戶目前的輪詢間隔（秒）"""
+        entry = self._entries.get(user_id)
+        return entry.interval if entry else self.min_interval
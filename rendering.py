@@ -0,0 +1,346 @@
+"""
+訊息渲染
+
+Boss通知和位置追蹤訊息共用同一套「排序 + 渲染」流程：每隻boss相對於某個錨點
+（Bunker或角色位置）的片段只渲染一次，以 (boss key, 錨點, 樣式) 為鍵緩存。
+渲染結果 RenderedMessage 可輸出為純文字或 Slack Block Kit，並按平台限制切分，
+超長內容會分成多段而不會被截斷。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+BUNKER_LOCATION = (1054, 987)
+HIGHLIGHT_DISTANCE = 1
+
+# Slack 限制
+SLACK_TEXT_LIMIT = 4000
+SLACK_MAX_BLOCKS = 50
+SLACK_SECTION_TEXT_LIMIT = 3000
+
+# 項目類型
+HEADER = "header"
+BODY = "body"
+SPACER = "spacer"
+
+# 預先綁定的模板
+NEARBY_TEMPLATE = "• {name} 在 ({x}, {y}) - 距離: {distance}格 ({direction})\n  時間: {start} - {end}".format
+NEARBY_HIGHLIGHT_TEMPLATE = "🚨 • {name} 在 ({x}, {y}) - 距離: {distance}格 ({direction}) 🚨\n🚨   時間: {start} - {end} 🚨".format
+DISTANCE_TEMPLATE = "• {name} 在 ({x}, {y}) - 距離: {distance}格 ({direction})".format
+DISTANCE_HIGHLIGHT_TEMPLATE = "🚨 • {name} 在 ({x}, {y}) - 距離: {distance}格 ({direction}) 🚨".format
+TRACKING_TITLE_TEMPLATE = "📍 **角色位置追蹤** - {username}".format
+POSITION_TEMPLATE = "當前位置: ({x}, {y})".format
+BUNKER_TEMPLATE = "🏠 **Secronom Bunker** - 距離: {distance}格 ({direction})".format
+
+
+def _safe_cut(line: str, limit: int) -> int:
+    """硬切位置；避免把 &amp; / &lt; / &gt; 之類的跳脫序列切開"""
+    entity_start = line.rfind("&", max(0, limit - 4), limit)
+    if entity_start > 0 and ";" not in line[entity_start:limit]:
+        return entity_start
+    return limit
+
+
+def split_text(text: str, limit: int) -> List[str]:
+    """把文字按行切分為不超過limit的多段；單行過長時硬切，不丟棄任何內容"""
+    if len(text) <= limit:
+        return [text]
+
+    pieces = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                pieces.append(current)
+                current = ""
+            cut = _safe_cut(line, limit)
+            pieces.append(line[:cut])
+            line = line[cut:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            pieces.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def to_mrkdwn(text: str) -> str:
+    """轉換為Slack mrkdwn（跳脫特殊字元，**粗體** 轉為 *粗體*）"""
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace("**", "*")
+
+
+class RenderedMessage:
+    """渲染後的訊息，由有類型的項目組成"""
+
+    def __init__(self, joiner: str = "\n"):
+        self.joiner = joiner
+        self.items: List[Tuple[str, str]] = []
+
+    @classmethod
+    def from_text(cls, text: str) -> "RenderedMessage":
+        message = cls()
+        if text:
+            message.add(text)
+        return message
+
+    def add(self, text: str, kind: str = BODY):
+        self.items.append((kind, text))
+
+    def text(self) -> str:
+        return self.joiner.join(text for _, text in self.items)
+
+    def __str__(self):
+        return self.text()
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _pieces(self, limit: int) -> List[Tuple[str, str]]:
+        """把每個項目切成不超過limit的小段"""
+        pieces = []
+        for kind, text in self.items:
+            pieces.extend((kind, piece) for piece in split_text(text, limit))
+        return pieces
+
+    @staticmethod
+    def _trim(chunk: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """去掉段落首尾的空白分隔"""
+        start, end = 0, len(chunk)
+        while start < end and chunk[start][0] == SPACER:
+            start += 1
+        while end > start and chunk[end - 1][0] == SPACER:
+            end -= 1
+        return chunk[start:end]
+
+    def text_chunks(self, limit: int = SLACK_TEXT_LIMIT) -> List[str]:
+        """切分為每段不超過limit字元的純文字"""
+        if len(self.text()) <= limit:
+            return [self.text()] if self.items else []
+
+        chunks = []
+        current: List[Tuple[str, str]] = []
+        length = 0
+        for kind, text in self._pieces(limit):
+            added = len(text) + (len(self.joiner) if current else 0)
+            if current and length + added > limit:
+                chunks.append(current)
+                current, length = [], 0
+                added = len(text)
+            current.append((kind, text))
+            length += added
+        if current:
+            chunks.append(current)
+
+        trimmed = (self._trim(chunk) for chunk in chunks)
+        return [self.joiner.join(text for _, text in chunk) for chunk in trimmed if chunk]
+
+    def block_chunks(self, limit: int = SLACK_TEXT_LIMIT, max_blocks: int = SLACK_MAX_BLOCKS) -> List[Tuple[str, List[dict]]]:
+        """
+        轉換為Slack Block Kit並切分
+        返回: [(後備文字（mrkdwn）, blocks), ...]，每段的block數和跳脫後的文字長度都在限制內
+        """
+        # 先轉換為mrkdwn再切分，長度限制以跳脫後的文字計算
+        pieces: List[Tuple[str, str]] = []
+        for kind, text in self.items:
+            if kind == HEADER:
+                # 標題整行加粗；先移除內部的 ** 以免粗體標記巢狀
+                text = f"*{to_mrkdwn(text.replace('**', ''))}*"
+            elif kind != SPACER:
+                text = to_mrkdwn(text)
+            pieces.extend((kind, piece) for piece in split_text(text, min(limit, SLACK_SECTION_TEXT_LIMIT)))
+
+        # 連續的內容項目合併為同一個section，減少block數量
+        merged: List[Tuple[str, str]] = []
+        for kind, text in pieces:
+            if kind == BODY and merged and merged[-1][0] == BODY:
+                combined = f"{merged[-1][1]}{self.joiner}{text}"
+                if len(combined) <= SLACK_SECTION_TEXT_LIMIT and len(combined) <= limit:
+                    merged[-1] = (BODY, combined)
+                    continue
+            merged.append((kind, text))
+
+        chunks = []
+        current: List[Tuple[str, str]] = []
+        length = 0
+        for kind, text in merged:
+            added = len(text) + (len(self.joiner) if current else 0)
+            if current and (length + added > limit or len(current) >= max_blocks):
+                chunks.append(current)
+                current, length = [], 0
+                added = len(text)
+            current.append((kind, text))
+            length += added
+        if current:
+            chunks.append(current)
+
+        results = []
+        for chunk in chunks:
+            chunk = self._trim(chunk)
+            if not chunk:
+                continue
+            blocks = []
+            for kind, text in chunk:
+                if kind == SPACER:
+                    blocks.append({"type": "divider"})
+                else:
+                    blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+            results.append((self.joiner.join(text for _, text in chunk), blocks))
+        return results
+
+
+def as_rendered(message) -> RenderedMessage:
+    """將字串或RenderedMessage統一為RenderedMessage"""
+    if isinstance(message, RenderedMessage):
+        return message
+    return RenderedMessage.from_text(str(message))
+
+
+def _chebyshev_distance(location: tuple, anchor: tuple) -> int:
+    return max(abs(int(location[0]) - int(anchor[0])), abs(int(location[1]) - int(anchor[1])))
+
+
+class _Fragment:
+    """單隻boss的渲染結果與排序鍵"""
+    __slots__ = ("sort_key", "text")
+
+    def __init__(self, sort_key: tuple, text: str):
+        self.sort_key = sort_key
+        self.text = text
+
+
+class MessageRenderer:
+    """以緩存片段渲染boss通知和位置追蹤訊息"""
+
+    def __init__(self, describe_location: Optional[Callable[[tuple], str]] = None, cache_size: int = 4096):
+        self.describe_location = describe_location
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, _Fragment]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def boss_key(game_id: str, start_time, end_time, location: tuple) -> tuple:
+        return (game_id, start_time.timestamp(), end_time.timestamp(), int(location[0]), int(location[1]))
+
+    def _key_of(self, boss) -> tuple:
+        """boss的緩存鍵；BossInfo物件只計算一次並記在物件上"""
+        if isinstance(boss, dict):
+            return (boss['name'],) + self.boss_key(boss['game_id'], boss['start_time'], boss['end_time'], boss['location'])
+        key = getattr(boss, '_render_key', None)
+        if key is None:
+            key = (type(boss).__name__, boss.name) + self.boss_key(boss.game_id, boss.start_time, boss.end_time, boss.location)
+            boss._render_key = key
+        return key
+
+    def _cached(self, key: tuple, build: Callable):
+        """LRU緩存（片段和整段排序結果共用）"""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return value
+        value = build()
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def _add_section(self, message: RenderedMessage, title: str, bosses: List, anchor: tuple, style: str,
+                     build_fragment: Callable[[object], _Fragment]):
+        """
+        共用的排序與輸出：1格內的優先，其餘按名稱再按距離
+        同一組boss對同一錨點的排序結果整段緩存，每個boss的片段另外緩存
+        """
+        keys = [self._key_of(boss) for boss in bosses]
+
+        def build_section():
+            fragments = [self._cached((key, anchor, style), lambda boss=boss: build_fragment(boss))
+                         for key, boss in zip(keys, bosses)]
+            return tuple(fragment.text for fragment in sorted(fragments, key=lambda fragment: fragment.sort_key))
+
+        message.add(title, HEADER)
+        for text in self._cached((style, anchor, tuple(keys)), build_section):
+            message.add(text)
+
+    # --- Boss通知 ---
+
+    def _boss_block(self, boss, anchor: tuple) -> _Fragment:
+        distance = _chebyshev_distance(boss.location, anchor)
+        text = str(boss)
+        if self.describe_location:
+            description = self.describe_location(boss.location)
+            if description:
+                text += f"\n{description}"
+        if distance <= HIGHLIGHT_DISTANCE:
+            # 為1格內的boss添加醒目emoji
+            first_line, _, rest = text.partition("\n")
+            text = f"🚨 {first_line} 🚨\n{rest}" if rest else f"🚨 {first_line} 🚨"
+        return _Fragment((0 if distance <= HIGHLIGHT_DISTANCE else 1, boss.name, distance), text)
+
+    def render_boss_message(self, big_bosses: List, small_bosses: List, anchor: tuple = BUNKER_LOCATION) -> RenderedMessage:
+        """渲染Big Boss / Small Boss通知（按距離錨點排序）"""
+        message = RenderedMessage(joiner="\n\n")
+        build = lambda boss: self._boss_block(boss, anchor)
+        if big_bosses:
+            self._add_section(message, "=== BIG BOSS ===", big_bosses, anchor, "boss_block", build)
+        if small_bosses:
+            if big_bosses:
+                message.add("", SPACER)
+            self._add_section(message, "=== SMALL BOSS ===", small_bosses, anchor, "boss_block", build)
+        return message
+
+    # --- 位置追蹤 ---
+
+    @staticmethod
+    def _nearby_line(boss: dict, player) -> _Fragment:
+        distance, direction = player.calculate_distance_to(boss['location'])
+        template = NEARBY_HIGHLIGHT_TEMPLATE if distance <= HIGHLIGHT_DISTANCE else NEARBY_TEMPLATE
+        text = template(name=boss['name'], x=boss['location'][0], y=boss['location'][1], distance=distance,
+                        direction=direction, start=boss['start_time'].strftime('%H:%M'),
+                        end=boss['end_time'].strftime('%H:%M'))
+        return _Fragment((0 if distance <= HIGHLIGHT_DISTANCE else 1, boss['name'], distance), text)
+
+    @staticmethod
+    def _distance_line(boss, player) -> _Fragment:
+        distance, direction = player.calculate_distance_to(boss.location)
+        template = DISTANCE_HIGHLIGHT_TEMPLATE if distance <= HIGHLIGHT_DISTANCE else DISTANCE_TEMPLATE
+        text = template(name=boss.name, x=boss.location[0], y=boss.location[1], distance=distance, direction=direction)
+        return _Fragment((0 if distance <= HIGHLIGHT_DISTANCE else 1, boss.name, distance), text)
+
+    def render_location_message(self, player, big_bosses: List, nearby_bosses: List,
+                                bunker_location: tuple = BUNKER_LOCATION) -> RenderedMessage:
+        """渲染位置追蹤訊息（按距離角色排序）"""
+        message = RenderedMessage(joiner="\n")
+        message.add(TRACKING_TITLE_TEMPLATE(username=player.username), HEADER)
+        message.add(POSITION_TEMPLATE(x=player.x, y=player.y))
+        movement = player.describe_movement()
+        if movement:
+            message.add(movement)
+        message.add("", SPACER)
+
+        if nearby_bosses:
+            self._add_section(message, "🎯 **角色3格範圍內的Boss**", nearby_bosses, player.location, "nearby",
+                              lambda boss: self._nearby_line(boss, player))
+            message.add("", SPACER)
+
+        if big_bosses:
+            self._add_section(message, "🔴 **BIG BOSS 距離**", big_bosses, player.location, "distance",
+                              lambda boss: self._distance_line(boss, player))
+            message.add("", SPACER)
+
+        bunker_distance, bunker_direction = player.calculate_distance_to(bunker_location)
+        message.add(BUNKER_TEMPLATE(distance=bunker_distance, direction=bunker_direction))
+
+        if not nearby_bosses and not big_bosses:
+            message.add("\n⚠️ 目前沒有符合條件的Boss")
+
+        return message
@@ -0,0 +1,274 @@
+"""
+加速時鐘回放引擎
+
+把錄製的 bossmap / profile 快照序列按模擬時間餵給 BossMonitor 的完整流程
+（偵測、清理、位置追蹤、通知），通知由 CapturingNotifier 收集。
+報告產生的通知數、相對於 boss start_time 的偵測延遲和各階段CPU時間。
+
+錄製: python replay.py record recording.jsonl --hours 24
+回放: python replay.py replay recording.jsonl --speed 1000   (--speed 0 表示不限速)
+
+錄製檔為JSONL，每行一個快照:
+    {"time": 1700000000.0, "bossmap": {...}}
+    {"time": 1700000005.0, "profiles": {"14008279": {...}}}
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from boss_monitor import BossMonitor
+from clock import SimulatedClock, SystemClock
+from notifiers import NotificationDispatcher, Notifier
+from settings import Settings, load_settings
+from transport import HttpTransport, RecordingTransport
+
+logger = logging.getLogger(__name__)
+
+
+def load_frames(path: str) -> List[Dict]:
+    """讀取錄製檔，按時間排序"""
+    frames = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                frames.append(json.loads(line))
+    frames.sort(key=lambda frame: frame['time'])
+    return frames
+
+
+class ReplayTransport:
+    """根據模擬時鐘返回當時最新的錄製快照"""
+
+    def __init__(self, frames: List[Dict], clock):
+        self.clock = clock
+        self._bossmap_times = []
+        self._bossmaps = []
+        self._profile_times: Dict[str, List[float]] = {}
+        self._profiles: Dict[str, List[Dict]] = {}
+        for frame in frames:
+            if 'bossmap' in frame:
+                self._bossmap_times.append(frame['time'])
+                self._bossmaps.append(frame['bossmap'])
+            for user_id, profile in frame.get('profiles', {}).items():
+                self._profile_times.setdefault(user_id, []).append(frame['time'])
+                self._profiles.setdefault(user_id, []).append(profile)
+
+    @staticmethod
+    def _latest(times: List[float], values: List, now: float):
+        index = bisect.bisect_right(times, now) - 1
+        return values[index] if index >= 0 else None
+
+    def get_json(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        now = self.clock.time()
+        if '/profile/json/' in url:
+            user_id = url.split('/profile/json/', 1)[1].split('?', 1)[0]
+            profile = self._latest(self._profile_times.get(user_id, []), self._profiles.get(user_id, []), now)
+            return profile if profile is not None else {}
+        bossmap = self._latest(self._bossmap_times, self._bossmaps, now)
+        return bossmap if bossmap is not None else {}
+
+    def get_text(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> str:
+        return json.dumps(self.get_json(url, headers, timeout), ensure_ascii=False)
+
+
+class CapturingNotifier(Notifier):
+    """收集通知而不實際發送"""
+
+    sink_type = "capture"
+
+    def __init__(self, clock, name: str = "capture", **kwargs):
+        super().__init__(name, retries=0, **kwargs)
+        self.clock = clock
+        self.notifications = []
+        self._lock = threading.Lock()
+
+    def deliver(self, rendered, channel: Optional[str]) -> None:
+        with self._lock:
+            self.notifications.append((self.clock.time(), channel, rendered))
+
+
+class ReplayReport:
+    """回放結果"""
+
+    def __init__(self, notifications: List, detections: List[Dict], stage_cpu: Dict[str, float],
+                 stage_calls: Dict[str, int], simulated_seconds: float, wall_seconds: float):
+        self.notifications = notifications
+        self.detections = detections
+        self.stage_cpu = stage_cpu
+        self.stage_calls = stage_calls
+        self.simulated_seconds = simulated_seconds
+        self.wall_seconds = wall_seconds
+
+    @property
+    def detection_delays(self) -> List[float]:
+        return sorted(detection['delay_seconds'] for detection in self.detections)
+
+    def summary(self) -> str:
+        lines = [
+            f"模擬時間: {self.simulated_seconds / 3600:.1f} 小時, 實際耗時: {self.wall_seconds:.2f} 秒",
+            f"通知數: {len(self.notifications)}, 偵測到的boss: {len(self.detections)}",
+        ]
+        delays = self.detection_delays
+        if delays:
+            p95 = delays[min(len(delays) - 1, int(len(delays) * 0.95))]
+            lines.append(f"偵測延遲: 平均 {sum(delays) / len(delays):.0f} 秒, "
+                         f"p95 {p95:.0f} 秒, 最大 {delays[-1]:.0f} 秒")
+        lines.append("各階段CPU時間（外層階段包含內部階段）:")
+        for stage, cpu in sorted(self.stage_cpu.items(), key=lambda item: -item[1]):
+            lines.append(f"  {stage}: {cpu * 1000:.1f} ms ({self.stage_calls[stage]} 次)")
+        return "\n".join(lines)
+
+
+class ReplayEngine:
+    """以模擬時鐘驅動 BossMonitor 的回放引擎"""
+
+    STAGES = (
+        'fetch_boss_data', 'fetch_player_location', 'fetch_nearby_bosses',
+        'render_boss_message', 'render_location_message', 'send_notification',
+    )
+
+    def __init__(self, frames: List[Dict], speed: float = 1000.0, user_id: Optional[str] = None,
+                 settings: Optional[Settings] = None, check_interval: Optional[float] = None,
+                 cleanup_interval: Optional[float] = None, location_interval: Optional[float] = None):
+        """
+        未指定的用戶和檢查/清理間隔（秒）取自 settings（預設為實際運行的 config.toml）
+        location_interval 為None時不回放位置追蹤
+        """
+        if not frames:
+            raise ValueError("沒有可回放的快照")
+        self.settings = settings or load_settings()
+        user_id = user_id or self.settings.default_user_id
+        check_interval = check_interval or self.settings.check_interval_minutes * 60
+        cleanup_interval = cleanup_interval or self.settings.cleanup_interval_minutes * 60
+        self.frames = frames
+        self.speed = speed
+        self.start_time = frames[0]['time']
+        self.end_time = frames[-1]['time']
+        self.clock = SimulatedClock(self.start_time)
+        self.sink = CapturingNotifier(self.clock)
+        self.monitor = BossMonitor(user_id, dispatcher=NotificationDispatcher([self.sink]),
+                                   clock=self.clock, transport=ReplayTransport(frames, self.clock),
+                                   settings=self.settings)
+        self.stage_cpu: Dict[str, float] = {}
+        self.stage_calls: Dict[str, int] = {}
+        self.detections: List[Dict] = []
+
+        self.jobs = [
+            (check_interval, self._timed('check_and_notify', self._check_and_record)),
+            (cleanup_interval, self._timed('cleanup_expired_bosses', self.monitor.cleanup_expired_bosses)),
+        ]
+        if location_interval:
+            self.jobs.append((location_interval, self._timed('location_tracking_cycle', self.monitor.location_tracking_cycle)))
+
+        # 計量流程內部的各階段
+        for stage in self.STAGES:
+            setattr(self.monitor, stage, self._timed(stage, getattr(self.monitor, stage)))
+
+    def _timed(self, stage: str, func):
+        def wrapper(*args, **kwargs):
+            started = time.process_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stage_cpu[stage] = self.stage_cpu.get(stage, 0.0) + time.process_time() - started
+                self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+        return wrapper
+
+    def _check_and_record(self):
+        """執行偵測，並記錄新boss相對於start_time的延遲"""
+        known = set(self.monitor.current_big_bosses) | set(self.monitor.current_small_bosses)
+        self.monitor.check_and_notify()
+        detected_at = self.clock.now()
+        for bosses in (self.monitor.current_big_bosses, self.monitor.current_small_bosses):
+            for boss_key, boss_info in bosses.items():
+                if boss_key not in known:
+                    self.detections.append({
+                        'key': boss_key,
+                        'name': boss_info.name,
+                        'start_time': boss_info.start_time,
+                        'detected_at': detected_at,
+                        'delay_seconds': max(0.0, (detected_at - boss_info.start_time).total_seconds()),
+                    })
+
+    def run(self) -> ReplayReport:
+        """回放整段錄製"""
+        wall_started = time.monotonic()
+        next_runs = [self.start_time for _ in self.jobs]
+
+        while True:
+            index = min(range(len(self.jobs)), key=lambda i: next_runs[i])
+            run_at = next_runs[index]
+            if run_at > self.end_time:
+                break
+
+            # 按加速倍率等待對應的實際時間
+            if self.speed:
+                delay = (run_at - self.clock.time()) / self.speed
+                if delay > 0:
+                    time.sleep(delay)
+            self.clock.set(run_at)
+
+            interval, job = self.jobs[index]
+            job()
+            next_runs[index] = run_at + interval
+
+        self.monitor.dispatcher.close()
+        return ReplayReport(self.sink.notifications, self.detections, self.stage_cpu, self.stage_calls,
+                            self.end_time - self.start_time, time.monotonic() - wall_started)
+
+
+def record_snapshots(path: str, user_ids: List[str], interval_seconds: float, duration_seconds: float):
+    """定時錄製實際的 bossmap 和角色 profile"""
+    clock = SystemClock()
+    transport = RecordingTransport(HttpTransport(), path, clock)
+    bossmap_monitor = BossMonitor(dispatcher=NotificationDispatcher([]), clock=clock, transport=transport)
+    profile_monitors = [BossMonitor(user_id, dispatcher=NotificationDispatcher([]), clock=clock, transport=transport)
+                        for user_id in user_ids]
+    deadline = clock.time() + duration_seconds
+
+    while clock.time() < deadline:
+        started = clock.time()
+        try:
+            bossmap_monitor.fetch_bossmap_json()
+        except Exception as e:
+            logger.error(f"錄製bossmap失敗: {e}")
+        for monitor in profile_monitors:
+            monitor.fetch_player_location()
+        clock.sleep(max(0.0, interval_seconds - (clock.time() - started)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Boss監控回放引擎")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="錄製實際快照")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--hours", type=float, default=24)
+    record_parser.add_argument("--interval", type=float, default=60, help="錄製間隔（秒）")
+    record_parser.add_argument("--user", action="append", default=[], help="同時錄製的用戶ID，可重複")
+
+    replay_parser = subparsers.add_parser("replay", help="回放錄製檔")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--speed", type=float, default=1000, help="加速倍率，0表示不限速")
+    replay_parser.add_argument("--user", default=None, help="默認為設定檔中的 default_user")
+    replay_parser.add_argument("--track-location", action="store_true", help="同時回放位置追蹤")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_snapshots(args.path, args.user, args.interval, args.hours * 3600)
+    else:
+        logging.getLogger().setLevel(logging.WARNING)
+        settings = load_settings()
+        location_interval = settings.location_interval_minutes * 60 if args.track_location else None
+        engine = ReplayEngine(load_frames(args.path), speed=args.speed, user_id=args.user, settings=settings,
+                              location_interval=location_interval)
+        print(engine.run().summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+可熱重載的設定
+
+config.py 提供預設值；設定檔（config.toml，或 .yaml/.yml）中的內容會覆蓋預設值，
+驗證後編譯為不可變的 Settings。SettingsStore 以輪詢修改時間的方式監看設定檔，
+變更時原子地替換目前的 Settings；監控程序和追蹤器在兩次週期之間套用新設定，
+已通知的boss、位置緩存等執行期狀態不受影響。設定檔有誤時保留舊設定並記錄錯誤。
+
+設定檔範例見 config.example.toml。
+"""
+
+import logging
+import os
+import threading
+import tomllib
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from config import (
+    SLACK_CHANNEL, CHECK_INTERVAL_MINUTES, CLEANUP_INTERVAL_MINUTES, USER_ID_MAPPING, DEFAULT_USER_ID,
+    LOCATION_TRACK_CHANNEL, LOCATION_CHECK_INTERVAL_MINUTES, POSITION_POLL_MAX_INTERVAL_MINUTES,
+    POSITION_HISTORY_SIZE, BOSS_CELL_FILTER, NOTIFICATION_SINKS
+)
+from map_grid import parse_flag_names
+from notifiers import build_notifiers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.toml')
+
+# 設定檔中允許的區段與鍵
+SETTINGS_SCHEMA = {
+    'default_user': None,
+    'users': None,
+    'channels': ('boss', 'location'),
+    'intervals': ('check', 'cleanup', 'location', 'position_poll_max'),
+    'anchors': ('bunker', 'small_boss_range', 'nearby_range'),
+    'tracker': ('workers',),
+    'position_history_size': None,
+    'boss_cell_filter': None,
+    'sinks': None,
+}
+
+
+class Settings(NamedTuple):
+    """編譯後的不可變設定（間隔單位為分鐘）"""
+    users: Mapping[str, str]
+    default_user_id: str
+    boss_channel: str
+    location_channel: str
+    check_interval_minutes: float
+    cleanup_interval_minutes: float
+    location_interval_minutes: float
+    position_poll_max_interval_minutes: float
+    position_history_size: int
+    boss_cell_filter: int
+    bunker_location: Tuple[int, int]
+    small_boss_range: int
+    nearby_range: int
+    tracker_workers: int
+    notification_sinks: Tuple[Mapping[str, Any], ...]
+
+    @property
+    def user_ids(self) -> Tuple[str, ...]:
+        return tuple(self.users.values())
+
+
+def _freeze(value):
+    """把巢狀的dict/list轉為唯讀結構"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """_freeze 的逆轉換（建立通知渠道時需要一般的dict/list）"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def _positive_number(value, name: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{name} 必須為正數: {value!r}")
+    return value
+
+
+def _non_negative_int(value, name: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{name} 必須為非負整數: {value!r}")
+    return value
+
+
+def _section(raw: Dict, name: str) -> Dict:
+    section = raw.get(name, {})
+    if not isinstance(section, dict):
+        raise ValueError(f"[{name}] 必須為表格")
+    unknown = set(section) - set(SETTINGS_SCHEMA[name])
+    if unknown:
+        raise ValueError(f"[{name}] 中有未知的設定: {', '.join(sorted(unknown))}")
+    return section
+
+
+def _check_sinks(sinks: List[Dict]):
+    """試建立通知渠道，確保錯誤的鍵或數值在載入時就被拒絕，而不是在套用時"""
+    try:
+        notifiers = build_notifiers([dict(sink) for sink in sinks])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"通知渠道設定無效: {e}")
+    for notifier in notifiers:
+        notifier.close()
+
+
+def compile_settings(raw: Optional[Dict] = None) -> Settings:
+    """驗證設定檔內容並與 config.py 的預設值合併；設定有誤時拋出ValueError"""
+    raw = raw or {}
+    unknown = set(raw) - set(SETTINGS_SCHEMA)
+    if unknown:
+        raise ValueError(f"未知的設定: {', '.join(sorted(unknown))}")
+
+    users = raw.get('users', USER_ID_MAPPING)
+    if not isinstance(users, dict) or not users:
+        raise ValueError("users 必須為非空的 {名稱: 用戶ID} 表格")
+    for name, user_id in users.items():
+        if not isinstance(user_id, str) or not user_id.isdigit():
+            raise ValueError(f"用戶 {name} 的ID必須為數字字串: {user_id!r}")
+
+    # default_user 可以是用戶名稱或ID；未指定且預設用戶不在列表中時使用第一個用戶
+    default_user = raw.get('default_user', DEFAULT_USER_ID)
+    if 'default_user' not in raw and default_user not in users.values():
+        default_user = next(iter(users.values()))
+    default_user_id = users.get(default_user, default_user)
+    if default_user_id not in users.values():
+        raise ValueError(f"default_user 不在 users 中: {default_user!r}")
+
+    channels = _section(raw, 'channels')
+    intervals = _section(raw, 'intervals')
+    anchors = _section(raw, 'anchors')
+    tracker = _section(raw, 'tracker')
+
+    bunker = anchors.get('bunker', (1054, 987))
+    if (not isinstance(bunker, (list, tuple)) or len(bunker) != 2 or
+            not all(isinstance(value, int) and not isinstance(value, bool) for value in bunker)):
+        raise ValueError(f"anchors.bunker 必須為 [x, y]: {bunker!r}")
+
+    cell_filter = raw.get('boss_cell_filter', BOSS_CELL_FILTER)
+    if not isinstance(cell_filter, list):
+        raise ValueError("boss_cell_filter 必須為列表")
+
+    sinks = raw.get('sinks', NOTIFICATION_SINKS)
+    if not isinstance(sinks, list) or not all(isinstance(sink, dict) and 'type' in sink for sink in sinks):
+        raise ValueError("sinks 必須為表格列表，且每個渠道都需要 type")
+    _check_sinks(sinks)
+
+    history_size = raw.get('position_history_size', POSITION_HISTORY_SIZE)
+    if isinstance(history_size, bool) or not isinstance(history_size, int) or history_size < 1:
+        raise ValueError(f"position_history_size 必須為正整數: {history_size!r}")
+
+    for name, value in channels.items():
+        if not isinstance(value, str) or not value:
+            raise ValueError(f"channels.{name} 必須為非空字串")
+
+    return Settings(
+        users=MappingProxyType(dict(users)),
+        default_user_id=default_user_id,
+        boss_channel=channels.get('boss', SLACK_CHANNEL),
+        location_channel=channels.get('location', LOCATION_TRACK_CHANNEL),
+        check_interval_minutes=_positive_number(intervals.get('check', CHECK_INTERVAL_MINUTES), "intervals.check"),
+        cleanup_interval_minutes=_positive_number(intervals.get('cleanup', CLEANUP_INTERVAL_MINUTES), "intervals.cleanup"),
+        location_interval_minutes=_positive_number(intervals.get('location', LOCATION_CHECK_INTERVAL_MINUTES),
+                                                   "intervals.location"),
+        position_poll_max_interval_minutes=_positive_number(
+            intervals.get('position_poll_max', POSITION_POLL_MAX_INTERVAL_MINUTES), "intervals.position_poll_max"),
+        position_history_size=history_size,
+        boss_cell_filter=parse_flag_names(cell_filter),
+        bunker_location=tuple(bunker),
+        small_boss_range=_non_negative_int(anchors.get('small_boss_range', 3), "anchors.small_boss_range"),
+        nearby_range=_non_negative_int(anchors.get('nearby_range', 3), "anchors.nearby_range"),
+        tracker_workers=_non_negative_int(tracker.get('workers', 0), "tracker.workers"),
+        notification_sinks=_freeze(sinks),
+    )
+
+
+DEFAULT_SETTINGS = compile_settings()
+
+
+def read_settings_file(path: str) -> Dict:
+    """讀取TOML或YAML設定檔"""
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("讀取YAML設定檔需要安裝 PyYAML，或改用 config.toml")
+        with open(path, encoding='utf-8') as f:
+            raw = yaml.safe_load(f) or {}
+        if not isinstance(raw, dict):
+            raise ValueError("YAML設定檔的最外層必須為映射")
+        return raw
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def load_settings(path: str = DEFAULT_SETTINGS_PATH) -> Settings:
+    """載入設定檔；檔案不存在時使用 config.py 的預設值"""
+    if not os.path.exists(path):
+        return DEFAULT_SETTINGS
+    try:
+        return compile_settings(read_settings_file(path))
+    except tomllib.TOMLDecodeError as e:
+        raise ValueError(f"設定檔格式錯誤: {e}")
+
+
+class SettingsStore:
+    """保存目前的設定，並監看設定檔的變更"""
+
+    def __init__(self, path: str = DEFAULT_SETTINGS_PATH, poll_interval: float = 2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._signature = self._file_signature()
+        # 啟動時設定有誤直接拋出異常，避免以錯誤設定運行
+        self._current = load_settings(path)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> Settings:
+        """目前的設定；每次讀取都是完整一致的Settings"""
+        return self._current
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """設定檔有變更時重新載入；返回設定是否已替換"""
+        with self._lock:
+            signature = self._file_signature()
+            if signature == self._signature and not force:
+                return False
+            self._signature = signature
+            try:
+                settings = load_settings(self.path)
+            except (OSError, ValueError) as e:
+                logger.error(f"載入設定檔失敗，繼續使用目前設定: {e}")
+                return False
+            if settings == self._current:
+                return False
+            self._current = settings
+        logger.info(f"已重新載入設定: {self.path}")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload()
+
+    def start(self):
+        """啟動背景監看線程"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="settings-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止監看"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
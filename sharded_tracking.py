@@ -0,0 +1,394 @@
+"""
+多進程分片位置追蹤
+
+協調者每個週期只請求並解析一次bossmap，把結果以扁平陣列寫入
+multiprocessing.shared_memory；用戶按穩定雜湊分配到固定的工作進程，
+工作進程直接讀取共享記憶體計算距離和訊息，快照本身不需要pickle。
+
+共享記憶體佈局（全部為 little-endian int64）:
+    header    : n_events, n_locations, strings_length, generation
+    events    : 每個事件 EVENT_FIELDS 個欄位
+                (start_time, end_time, first_location, location_count, is_big)
+    locations : 每個位置 2 個欄位 (x, y)，同一事件的位置連續存放
+    strings   : UTF-8 JSON，[[game_id, boss_name], ...]，與events同序
+"""
+
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import schedule
+
+from boss_monitor import BossInfo, BossMonitor, PlayerLocation
+from notifiers import NotificationDispatcher, build_notifiers
+from position_cache import PositionCache
+from rendering import BUNKER_LOCATION, RenderedMessage
+from settings import DEFAULT_SETTINGS, Settings, SettingsStore, thaw
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<4q')
+EVENT_FIELDS = 5
+ITEM_SIZE = 8
+NEARBY_RANGE = 3
+
+
+def publish_snapshot(data: dict, now: float, generation: int = 0) -> SharedMemory:
+    """將bossmap JSON中仍在進行的boss事件寫入新的共享記憶體區塊"""
+    events = array('q')
+    locations = array('q')
+    strings = []
+
+    for game_id, boss_data in data.items():
+        if not isinstance(boss_data, dict):
+            continue
+
+        # 與 BossMonitor.fetch_boss_data 相同的boss事件判斷
+        if not (boss_data.get('locations') and
+                boss_data.get('special_enemy_type') and
+                boss_data['special_enemy_type'] != '0'):
+            continue
+
+        # 先解析完整個事件再寫入，格式錯誤的事件整個略過
+        try:
+            start_timestamp = int(boss_data['start_time'])
+            end_timestamp = int(boss_data['end_time'])
+            event_locations = [(int(location[0]), int(location[1])) for location in boss_data['locations']]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.warning(f"略過格式錯誤的boss事件 {game_id}: {e!r}")
+            continue
+        if end_timestamp <= now:
+            continue
+
+        duration_minutes = (end_timestamp - start_timestamp) / 60
+        is_big = 1 if 61 <= duration_minutes <= 240 else 0
+
+        events.extend((start_timestamp, end_timestamp, len(locations) // 2, len(event_locations), is_big))
+        for x, y in event_locations:
+            locations.extend((x, y))
+        strings.append([game_id, boss_data['special_enemy_type']])
+
+    string_bytes = json.dumps(strings, ensure_ascii=False).encode('utf-8')
+    events_size = len(events) * ITEM_SIZE
+    locations_size = len(locations) * ITEM_SIZE
+
+    shm = SharedMemory(create=True, size=HEADER.size + events_size + locations_size + len(string_bytes))
+    offset = HEADER.size
+    HEADER.pack_into(shm.buf, 0, len(events) // EVENT_FIELDS, len(locations) // 2, len(string_bytes), generation)
+    shm.buf[offset:offset + events_size] = events.tobytes()
+    offset += events_size
+    shm.buf[offset:offset + locations_size] = locations.tobytes()
+    offset += locations_size
+    shm.buf[offset:offset + len(string_bytes)] = string_bytes
+    return shm
+
+
+class BossSnapshotView:
+    """以零拷貝方式讀取共享記憶體中的boss快照"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._shm = SharedMemory(name=name)
+        n_events, n_locations, strings_length, self.generation = HEADER.unpack_from(self._shm.buf, 0)
+
+        offset = HEADER.size
+        events_end = offset + n_events * EVENT_FIELDS * ITEM_SIZE
+        locations_end = events_end + n_locations * 2 * ITEM_SIZE
+        self.n_events = n_events
+        self.events = self._shm.buf[offset:events_end].cast('q')
+        self.locations = self._shm.buf[events_end:locations_end].cast('q')
+        # 字串表和時間在每個快照只解碼一次，供所有用戶共用
+        self.strings = json.loads(bytes(self._shm.buf[locations_end:locations_end + strings_length]).decode('utf-8'))
+        self._times: Optional[List[Tuple[datetime, datetime]]] = None
+
+    def event_times(self, index: int) -> Tuple[datetime, datetime]:
+        """返回事件的 (start_time, end_time)"""
+        if self._times is None:
+            self._times = [
+                (datetime.fromtimestamp(self.events[i * EVENT_FIELDS]),
+                 datetime.fromtimestamp(self.events[i * EVENT_FIELDS + 1]))
+                for i in range(self.n_events)
+            ]
+        return self._times[index]
+
+    def bosses_for(self, player: PlayerLocation, nearby_range: int = NEARBY_RANGE) -> Tuple[List, List[BossInfo]]:
+        """
+        計算角色附近的boss和所有Big Boss
+        返回: (nearby_bosses, big_bosses)，格式與 BossMonitor 的 fetch 結果相同
+        """
+        events = self.events
+        locations = self.locations
+        player_x, player_y = player.x, player.y
+        nearby_bosses = []
+        big_bosses = []
+
+        for index in range(self.n_events):
+            base = index * EVENT_FIELDS
+            first_location = events[base + 2]
+            location_count = events[base + 3]
+
+            nearby_locations = []
+            for location_index in range(first_location, first_location + location_count):
+                boss_x = locations[location_index * 2]
+                boss_y = locations[location_index * 2 + 1]
+                if max(abs(boss_x - player_x), abs(boss_y - player_y)) <= nearby_range:
+                    nearby_locations.append((boss_x, boss_y))
+
+            is_big = events[base + 4]
+            if not nearby_locations and not is_big:
+                continue
+
+            game_id, boss_name = self.strings[index]
+            start_time, end_time = self.event_times(index)
+
+            for i, location in enumerate(nearby_locations):
+                boss_display_name = boss_name if len(nearby_locations) == 1 else f"{boss_name} #{i+1}"
+                nearby_bosses.append({
+                    'game_id': f"{game_id}_{i}",
+                    'name': boss_display_name,
+                    'location': location,
+                    'start_time': start_time,
+                    'end_time': end_time
+                })
+
+            if is_big:
+                first = (locations[first_location * 2], locations[first_location * 2 + 1])
+                big_bosses.append(BossInfo(game_id, boss_name, start_time, end_time, first))
+
+        return nearby_bosses, big_bosses
+
+    def close(self):
+        """釋放對共享記憶體的引用（不會刪除區塊）"""
+        self.events.release()
+        self.locations.release()
+        self._shm.close()
+
+
+# 工作進程內的狀態（每個進程一份）
+_worker_view: Optional[BossSnapshotView] = None
+_worker_formatter: Optional[BossMonitor] = None
+
+
+def _attach_snapshot(name: str) -> BossSnapshotView:
+    """附加到指定快照；快照改變時釋放舊的"""
+    global _worker_view
+    if _worker_view is None or _worker_view.name != name:
+        if _worker_view is not None:
+            _worker_view.close()
+            _worker_view = None
+        _worker_view = BossSnapshotView(name)
+    return _worker_view
+
+
+def track_shard(snapshot_name: str, players: List[Tuple[str, str, int, int, List]], nearby_range: int = NEARBY_RANGE,
+                bunker_location: tuple = BUNKER_LOCATION) -> List[Tuple[str, RenderedMessage]]:
+    """
+    在工作進程中為一個分片的用戶生成位置追蹤訊息
+    players: [(user_id, username, x, y, recent_positions), ...]
+    nearby_range / bunker_location 由協調者按目前設定傳入
+    返回: [(user_id, RenderedMessage), ...]
+    """
+    global _worker_formatter
+    if _worker_formatter is None:
+        _worker_formatter = BossMonitor(dispatcher=NotificationDispatcher([]))
+
+    view = _attach_snapshot(snapshot_name)
+    results = []
+    for user_id, username, x, y, recent_positions in players:
+        player = PlayerLocation(user_id, username, x, y, recent_positions)
+        nearby_bosses, big_bosses = view.bosses_for(player, nearby_range)
+        message = _worker_formatter.renderer.render_location_message(player, big_bosses, nearby_bosses, bunker_location)
+        results.append((user_id, message))
+    return results
+
+
+class ShardedLocationTracker:
+    """多角色位置追蹤協調者"""
+
+    def __init__(self, user_ids: List[str], num_workers: Optional[int] = None,
+                 dispatcher: Optional[NotificationDispatcher] = None, io_workers: int = 16,
+                 base_url: Optional[str] = None, position_cache: Optional[PositionCache] = None,
+                 settings: Optional[Settings] = None):
+        self.settings = settings or DEFAULT_SETTINGS
+        self._fixed_workers = num_workers
+        self.num_workers = self._worker_count(self.settings)
+        self._owns_dispatcher = dispatcher is None
+        self.dispatcher = dispatcher or NotificationDispatcher(build_notifiers(thaw(self.settings.notification_sinks)))
+        self.base_url = base_url
+        # 所有角色共用同一個位置緩存（未指定時使用第一個監控實例建立的緩存）
+        self.position_cache = position_cache
+        self.monitors: Dict[str, BossMonitor] = {}
+        for user_id in user_ids:
+            self._add_monitor(user_id)
+        self.generation = 0
+        # 每個分片一個單進程執行器，保證同一用戶總是在同一進程處理
+        self._context = get_context('spawn')
+        self._shards = [ProcessPoolExecutor(max_workers=1, mp_context=self._context) for _ in range(self.num_workers)]
+        self._io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="tracker-io")
+        self._job: Optional[schedule.Job] = None
+
+    def _worker_count(self, settings: Settings) -> int:
+        """工作進程數：建構時指定的優先，其次為設定中的 tracker.workers，0表示CPU數"""
+        return max(1, self._fixed_workers or settings.tracker_workers or os.cpu_count() or 1)
+
+    def _add_monitor(self, user_id: str):
+        monitor = BossMonitor(user_id, dispatcher=self.dispatcher, base_url=self.base_url,
+                              position_cache=self.position_cache, settings=self.settings)
+        self.position_cache = monitor.position_cache
+        self.monitors[user_id] = monitor
+
+    def apply_settings(self, settings: Settings):
+        """
+        套用新設定：增減追蹤的角色、調整工作進程數和通知渠道
+        保留中的角色沿用原有的監控實例和位置緩存
+        """
+        # 先建立新的通知渠道，失敗時不改變任何狀態
+        if self._owns_dispatcher and settings.notification_sinks != self.settings.notification_sinks:
+            self.dispatcher.replace_notifiers(build_notifiers(thaw(settings.notification_sinks)))
+        self.settings = settings
+
+        user_ids = set(settings.user_ids)
+        for user_id in [user_id for user_id in self.monitors if user_id not in user_ids]:
+            del self.monitors[user_id]
+        for monitor in self.monitors.values():
+            monitor.apply_settings(settings)
+        for user_id in settings.user_ids:
+            if user_id not in self.monitors:
+                self._add_monitor(user_id)
+
+        # 只新增或關閉差額的工作進程
+        num_workers = self._worker_count(settings)
+        while len(self._shards) < num_workers:
+            self._shards.append(ProcessPoolExecutor(max_workers=1, mp_context=self._context))
+        while len(self._shards) > num_workers:
+            self._shards.pop().shutdown(wait=True)
+        self.num_workers = num_workers
+        logger.info(f"已套用新設定: {len(self.monitors)} 個角色, {self.num_workers} 個工作進程")
+
+    def shard_for(self, user_id: str) -> int:
+        """用戶的穩定分片編號"""
+        return zlib.crc32(user_id.encode('utf-8')) % self.num_workers
+
+    def fetch_players(self) -> List[PlayerLocation]:
+        """並行獲取所有角色位置"""
+        players = self._io_pool.map(lambda monitor: monitor.fetch_player_location(), self.monitors.values())
+        return [player for player in players if player]
+
+    def compute_messages(self, snapshot_name: str, players: List[PlayerLocation]) -> List[Tuple[str, RenderedMessage]]:
+        """把角色按分片派發到工作進程並收集訊息"""
+        shards: Dict[int, List[Tuple[str, str, int, int, List]]] = {}
+        for player in players:
+            shards.setdefault(self.shard_for(player.user_id), []).append(
+                (player.user_id, player.username, player.x, player.y, player.recent_positions))
+
+        futures = []
+        for shard_index, shard_players in shards.items():
+            try:
+                future = self._shards[shard_index].submit(track_shard, snapshot_name, shard_players,
+                                                          self.settings.nearby_range, self.settings.bunker_location)
+            except BrokenProcessPool:
+                self._replace_shard(shard_index)
+                continue
+            futures.append((shard_index, future))
+
+        # 單個分片失敗只影響該分片的用戶
+        messages = []
+        for shard_index, future in futures:
+            try:
+                messages.extend(future.result())
+            except BrokenProcessPool as e:
+                logger.error(f"分片 {shard_index} 的工作進程已終止: {e}")
+                self._replace_shard(shard_index)
+            except Exception as e:
+                logger.error(f"分片 {shard_index} 計算位置追蹤訊息失敗: {e!r}")
+        return messages
+
+    def _replace_shard(self, shard_index: int):
+        """以新的工作進程替換已損壞的分片執行器"""
+        self._shards[shard_index].shutdown(wait=False, cancel_futures=True)
+        self._shards[shard_index] = ProcessPoolExecutor(max_workers=1, mp_context=self._context)
+        logger.warning(f"已重建分片 {shard_index} 的工作進程")
+
+    def tracking_cycle(self) -> Dict[str, float]:
+        """
+        執行一次所有角色的位置追蹤
+        返回: {用戶ID: 由週期開始到該用戶訊息發送完成的秒數}（無法取得位置的用戶不包含在內）
+        """
+        if not self.monitors:
+            return {}
+        started = time.monotonic()
+        logger.info(f"開始分片位置追蹤: {len(self.monitors)} 個角色, {self.num_workers} 個工作進程")
+
+        any_monitor = next(iter(self.monitors.values()))
+        try:
+            data = any_monitor.fetch_bossmap_json()
+        except Exception as e:
+            logger.error(f"獲取boss數據時發生錯誤: {e}")
+            data = {}
+
+        players = self.fetch_players()
+        self.generation += 1
+        shm = publish_snapshot(data, any_monitor.clock.time(), self.generation)
+        try:
+            messages = self.compute_messages(shm.name, players)
+        finally:
+            shm.close()
+            shm.unlink()
+
+        channel = self.settings.location_channel
+
+        def deliver(item: Tuple[str, RenderedMessage]) -> Tuple[str, float]:
+            user_id, message = item
+            self.dispatcher.dispatch(message, channel)
+            return user_id, time.monotonic() - started
+
+        latencies = dict(self._io_pool.map(deliver, messages))
+        logger.info(f"已發送 {len(messages)} 則位置追蹤訊息到 {channel}")
+        return latencies
+
+    def sync_schedule(self):
+        """按目前設定的間隔排程追蹤週期，間隔未變時保留原有排程"""
+        interval = self.settings.location_interval_minutes
+        if self._job is not None and self._job.interval == interval:
+            return
+        if self._job is not None:
+            schedule.cancel_job(self._job)
+        self._job = schedule.every(interval).minutes.do(self.tracking_cycle)
+
+    def run(self, settings_store: Optional[SettingsStore] = None):
+        """運行多角色追蹤模式；設定檔變更時在兩次週期之間套用"""
+        logger.info("多角色分片追蹤模式啟動")
+
+        schedule.clear()
+        self._job = None
+        self.sync_schedule()
+
+        self.tracking_cycle()
+
+        try:
+            while True:
+                if settings_store is not None and settings_store.current is not self.settings:
+                    self.apply_settings(settings_store.current)
+                    self.sync_schedule()
+                schedule.run_pending()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("收到停止信號，程序退出")
+        finally:
+            self.close()
+
+    def close(self):
+        """關閉工作進程和線程池"""
+        for shard in self._shards:
+            shard.shutdown(wait=True, cancel_futures=True)
+        self._io_pool.shutdown(wait=False)
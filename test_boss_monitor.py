@@ -3,9 +3,25 @@
 測試Boss監控系統
 """
 
+import os
 import sys
+import tempfile
+import time
+import schedule
 from datetime import datetime
 from boss_monitor import BossMonitor, BossInfo, SmallBossInfo
+import requests
+import notifiers
+from notifiers import Notifier, NotificationDispatcher, SlackNotifier
+from boss_monitor import PlayerLocation
+from map_grid import FLAG_BOSS_CYCLE, FLAG_MISSION, FLAG_OUTPOST, MapGrid, compile_map_grid
+from clock import SimulatedClock
+from position_cache import PositionCache, PositionHistory, extract_profile_location
+from loadtest import FaultProfile, LoadTest, StandInServer
+from rendering import SLACK_MAX_BLOCKS, SLACK_SECTION_TEXT_LIMIT, RenderedMessage
+from settings import DEFAULT_SETTINGS, SettingsStore
+from replay import ReplayEngine, ReplayTransport
+from sharded_tracking import BossSnapshotView, ShardedLocationTracker, publish_snapshot
 
 
 def test_fetch_boss_data():
@@ -89,6 +105,424 @@ def test_slack_notification():
         return True
 
 
+class FakeNotifier(Notifier):
+    """測試用渠道，記錄收到的訊息"""
+    render_calls = 0
+
+    def __init__(self, name, delay=0.0, fail=False, **kwargs):
+        super().__init__(name, retry_backoff=0, **kwargs)
+        self.delay = delay
+        self.fail = fail
+        self.delivered = []
+
+    def render(self, message):
+        FakeNotifier.render_calls += 1
+        return message.upper()
+
+    def deliver(self, rendered, channel):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("sink down")
+        self.delivered.append((rendered, channel))
+
+
+class BrokenRenderNotifier(Notifier):
+    """測試用渠道，格式化時拋出異常"""
+
+    def render(self, message):
+        raise RuntimeError("bad template")
+
+    def deliver(self, rendered, channel):
+        raise AssertionError("不應被呼叫")
+
+
+def test_notification_dispatch():
+    """測試多渠道並行派發"""
+    print("\n=== 測試多渠道派發 ===")
+    FakeNotifier.render_calls = 0
+    fast = FakeNotifier("fast")
+    slow = FakeNotifier("slow", delay=0.5)
+    dead = FakeNotifier("dead", fail=True, retries=1)
+    dispatcher = NotificationDispatcher([fast, slow, dead])
+
+    started = time.monotonic()
+    results = dispatcher.dispatch("boss", "#test")
+    elapsed = time.monotonic() - started
+    dispatcher.close()
+
+    print(f"派發結果: {results}, 耗時 {elapsed:.2f} 秒")
+    assert results == {"fast": True, "slow": True, "dead": False}
+    assert fast.delivered == [("BOSS", "#test")]
+    # 同類型渠道只格式化一次
+    assert FakeNotifier.render_calls == 1
+    # 渠道並行運行，總耗時接近最慢的渠道而不是總和
+    assert elapsed < 1.0
+
+    monitor = BossMonitor(dispatcher=NotificationDispatcher([FakeNotifier("ok"), FakeNotifier("bad", fail=True, retries=0)]))
+    assert monitor.send_notification("partial") is True
+
+    # 一個渠道格式化失敗不影響其他渠道
+    ok = FakeNotifier("ok")
+    dispatcher = NotificationDispatcher([BrokenRenderNotifier("broken"), ok])
+    results = dispatcher.dispatch("boss", "#test")
+    dispatcher.close()
+    assert results == {"broken": False, "ok": True}
+    assert ok.delivered == [("BOSS", "#test")]
+    return True
+
+
+def make_sample_bossmap(now):
+    """生成測試用的bossmap JSON數據"""
+    now = int(now)
+    return {
+        "5": {"special_enemy_type": "Devil Hound", "start_time": now - 600, "end_time": now + 3 * 3600,
+              "locations": [[1053, 990]]},
+        "12": {"special_enemy_type": "Bandits", "start_time": now - 60, "end_time": now + 1800,
+               "locations": [[1055, 988], [1056, 986], [1020, 1000]]},
+        "13": {"special_enemy_type": "Flaming Zombie", "start_time": now - 7200, "end_time": now - 60,
+               "locations": [[1054, 987]]},
+        "14": {"special_enemy_type": "0", "start_time": now, "end_time": now + 600, "locations": [[1054, 987]]},
+        "meta": "not a boss",
+    }
+
+
+def test_sharded_tracking():
+    """測試共享記憶體快照與分片追蹤"""
+    print("\n=== 測試分片追蹤 ===")
+    now = time.time()
+    data = make_sample_bossmap(now)
+    monitor = BossMonitor(dispatcher=NotificationDispatcher([]))
+    player = PlayerLocation("1", "tester", 1054, 987)
+
+    # 快照計算結果應與直接解析JSON的結果一致
+    expected = monitor.format_location_tracking_message(
+        player, monitor.fetch_boss_data(data)[0], monitor.fetch_nearby_bosses(player.location, data))
+    # 格式錯誤的事件被略過，不影響其他事件
+    broken_data = dict(data, broken={"special_enemy_type": "Broken", "start_time": int(now), "locations": [[1054, 987]]})
+    shm = publish_snapshot(broken_data, now)
+    try:
+        view = BossSnapshotView(shm.name)
+        nearby_bosses, big_bosses = view.bosses_for(player)
+        actual = monitor.format_location_tracking_message(player, big_bosses, nearby_bosses)
+        view.close()
+        print(actual)
+        assert actual == expected
+        assert [boss['name'] for boss in nearby_bosses] == ["Devil Hound", "Bandits #1", "Bandits #2"]
+
+        tracker = ShardedLocationTracker([], num_workers=2, dispatcher=NotificationDispatcher([]))
+        try:
+            assert tracker.shard_for("14008279") == tracker.shard_for("14008279")
+            players = [PlayerLocation(str(i), f"runner{i}", 1054, 987) for i in range(6)]
+            messages = dict(tracker.compute_messages(shm.name, players))
+
+            # 分片失敗只記錄錯誤；工作進程終止後分片會被重建
+            assert tracker.compute_messages("missing-snapshot", players) == []
+            for process in list(tracker._shards[0]._processes.values()):
+                process.kill()
+                process.join()
+            tracker.compute_messages(shm.name, players)
+            assert len(tracker.compute_messages(shm.name, players)) == 6
+        finally:
+            tracker.close()
+        assert sorted(messages) == [str(i) for i in range(6)]
+        assert str(messages["0"]) == expected.replace("tester", "runner0")
+    finally:
+        shm.close()
+        shm.unlink()
+    return True
+
+
+def test_map_grid():
+    """測試地圖格子編譯與查詢"""
+    print("\n=== 測試地圖格子 ===")
+    with tempfile.TemporaryDirectory() as directory:
+        path = compile_map_grid(output_path=os.path.join(directory, "map_grid.bin"))
+        grid = MapGrid(path)
+        try:
+            bunker = grid.cell_at(1054, 987)
+            print(f"Bunker格子: {bunker}, 最近地標: {grid.nearest_landmark(1010, 981)}")
+            assert bunker.title == "Secronom Bunker" and bunker.has_flag(FLAG_OUTPOST)
+            assert grid.has_flag(1010, 981, FLAG_BOSS_CYCLE)
+            assert grid.cell_at(1005, 981).label == "M3" and grid.has_flag(1005, 981, FLAG_MISSION)
+            assert grid.flags_at(1, 1) == 0 and grid.cell_at(1, 1) is None
+            assert grid.nearest_landmark(1054, 987) == ("Secronom Bunker", 1054, 987, 0)
+            assert len(list(grid.cells_with(FLAG_MISSION))) == 7
+
+            monitor = BossMonitor(dispatcher=NotificationDispatcher([]), map_grid=grid)
+            description = monitor.describe_location((1010, 981))
+            print(description)
+            assert description.startswith("Zone: I2 Flaming Zombie [boss-cycle]")
+            # 最近地標是Bunker錨點時不重複顯示
+            assert "Nearest landmark" not in description
+            relocated = BossMonitor(dispatcher=NotificationDispatcher([]), map_grid=grid,
+                                    settings=DEFAULT_SETTINGS._replace(bunker_location=(1000, 1000)))
+            assert relocated.describe_location((1010, 981)).endswith("Nearest landmark: Secronom Bunker (44格)")
+        finally:
+            grid.close()
+    return True
+
+
+def test_replay_engine():
+    """測試加速回放一整天的快照"""
+    print("\n=== 測試回放引擎 ===")
+    day_start = 1_700_000_000
+    frames = []
+    for minute in range(0, 24 * 60, 5):
+        now = day_start + minute * 60
+        # 每小時整點出現一隻持續2小時的Big Boss
+        hour_start = now - (now - day_start) % 3600
+        bossmap = {
+            str(hour_start): {"special_enemy_type": "Devil Hound", "start_time": hour_start,
+                              "end_time": hour_start + 7200, "locations": [[1053, 990]]},
+        }
+        frames.append({"time": now, "bossmap": bossmap})
+        frames.append({"time": now + 1, "profiles": {"1": {"gpscoords": [1054, 987], "override": {"account_name": "tester"}}}})
+
+    # 未指定的間隔取自設定
+    tuned = ReplayEngine(frames, speed=0, settings=DEFAULT_SETTINGS._replace(check_interval_minutes=2,
+                                                                           cleanup_interval_minutes=15))
+    assert [interval for interval, _ in tuned.jobs] == [120, 900]
+    assert tuned.monitor.user_id == DEFAULT_SETTINGS.default_user_id
+    tuned.monitor.dispatcher.close()
+
+    engine = ReplayEngine(frames, speed=0, user_id="1", location_interval=600)
+    report = engine.run()
+    print(report.summary())
+    assert len(report.detections) == 24
+    # 快照每5分鐘一次且整點出現，偵測延遲應不超過一個檢查週期
+    assert max(report.detection_delays) <= 300
+    location_messages = [n for n in report.notifications if n[1] == "#dflocationtrack"]
+    assert len(report.notifications) - len(location_messages) == 24
+    assert report.stage_calls["check_and_notify"] >= 24 * 12
+    assert report.wall_seconds < 30
+    return True
+
+
+def test_load_harness():
+    """測試本地替身伺服器和負載測試流程"""
+    print("\n=== 測試負載測試工具 ===")
+    server = StandInServer(FaultProfile(latency=0.05), FaultProfile(throttle_rate=0.3, retry_after=0.1),
+                           boss_count=10).start()
+    load_test = LoadTest(server, users=5, interval=0.5, sink_retries=10)
+    try:
+        report = load_test.run(duration=1.0)
+    finally:
+        load_test.close()
+        server.stop()
+
+    print(report.summary())
+    assert report.ticks >= 2
+    assert len(report.cycle_latencies) == report.ticks * 5
+    # 靜止的角色會使用位置緩存，profile請求不多於用戶週期數
+    assert 5 <= server.status_counts["profile"][200] <= report.ticks * 5
+    # 被限流的webhook會重試，最終所有訊息都送達
+    assert server.status_counts["webhook"][200] == report.ticks * 5
+
+    # 分片模式的冒煙測試：每個用戶每週期都有延遲記錄
+    server = StandInServer(FaultProfile(), FaultProfile(), boss_count=10).start()
+    load_test = LoadTest(server, users=3, interval=0.5, mode="sharded", shard_workers=1)
+    try:
+        report = load_test.run(duration=0.5)
+    finally:
+        load_test.close()
+        server.stop()
+
+    print(report.summary())
+    assert report.ticks >= 1
+    assert len(report.cycle_latencies) == report.ticks * 3
+    assert "個用戶週期" in report.summary()
+    assert server.status_counts["webhook"][200] == report.ticks * 3
+    return True
+
+
+class CountingProfileTransport:
+    """測試用transport，返回固定profile並計算請求次數"""
+    def __init__(self, text):
+        self.text = text
+        self.requests = 0
+
+    def get_text(self, url, headers=None, timeout=30):
+        self.requests += 1
+        return self.text
+
+
+def test_position_cache():
+    """測試位置緩存、環形緩衝區和自適應輪詢"""
+    print("\n=== 測試位置緩存 ===")
+    history = PositionHistory(capacity=3)
+    for i in range(5):
+        history.append(i * 60.0, 1000 + i, 990)
+    assert list(history) == [(120.0, 1002, 990), (180.0, 1003, 990), (240.0, 1004, 990)]
+    assert history.latest() == (240.0, 1004, 990)
+
+    profile = '{"gpscoords": ["1054", "987"], "stats": {"level": 99}, "override": {"account_name": "tom\\u00e9"}}'
+    assert extract_profile_location(profile) == ("tom\u00e9", 1054, 987)
+    assert extract_profile_location('{"gpscoords": [1, 2]}') is None
+
+    clock = SimulatedClock(1_700_000_000)
+    transport = CountingProfileTransport(profile)
+    cache = PositionCache(min_interval=60, max_interval=600)
+    monitor = BossMonitor("1", dispatcher=NotificationDispatcher([]), clock=clock, transport=transport,
+                          position_cache=cache)
+
+    # 角色靜止一小時，每分鐘查詢一次
+    for _ in range(60):
+        player = monitor.fetch_player_location()
+        clock.advance(60)
+    print(f"60次查詢中實際請求 {transport.requests} 次, 目前間隔 {cache.interval('1')} 秒")
+    assert player.location == (1054, 987)
+    assert transport.requests < 15
+    assert cache.interval("1") == 600
+    assert player.describe_movement().startswith("已停留")
+
+    # 開始移動後恢復最短間隔
+    transport.text = profile.replace('"1054"', '"1055"')
+    player = monitor.fetch_player_location(force=True)
+    assert cache.interval("1") == 60
+    assert player.describe_movement().startswith("最近移動: 1右")
+    assert "最近移動: 1右" in monitor.format_location_tracking_message(player, [], [])
+    return True
+
+
+def test_rendering():
+    """測試片段緩存、Block Kit輸出和超長訊息切分"""
+    print("\n=== 測試訊息渲染 ===")
+    monitor = BossMonitor(dispatcher=NotificationDispatcher([]))
+    start = datetime(2026, 1, 1, 12, 0)
+    end = datetime(2026, 1, 1, 14, 0)
+    big_bosses = [BossInfo(str(i), f"Boss {i % 7}", start, end, (1000 + i % 60, 960 + i // 60)) for i in range(300)]
+
+    message = monitor.render_boss_message(big_bosses, [])
+    misses = monitor.renderer.misses
+    assert monitor.render_boss_message(big_bosses, []).text() == message.text()
+    assert monitor.renderer.misses == misses
+
+    # 切分後不超過限制，且內容完整
+    text = message.text()
+    chunks = message.text_chunks(4000)
+    print(f"訊息長度 {len(text)} 字元，切分為 {len(chunks)} 段")
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 4000 for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+
+    for fallback, blocks in message.block_chunks():
+        assert len(fallback) <= 4000
+        assert len(blocks) <= SLACK_MAX_BLOCKS
+        assert all(len(block["text"]["text"]) <= SLACK_SECTION_TEXT_LIMIT for block in blocks if block["type"] == "section")
+    first_blocks = message.block_chunks()[0][1]
+    assert first_blocks[0]["text"]["text"] == "*=== BIG BOSS ===*"
+
+    # 位置追蹤訊息的標題在Block Kit中是單層粗體
+    player = PlayerLocation("1", "tom", 1054, 987)
+    nearby = [{"game_id": "1_0", "name": "Bandits", "location": (1055, 987), "start_time": start, "end_time": end}]
+    location_blocks = monitor.render_location_message(player, big_bosses[:2], nearby).block_chunks()[0][1]
+    headers = [block["text"]["text"] for block in location_blocks
+               if block["type"] == "section" and block["text"]["text"].startswith("*")]
+    assert headers == ["*📍 角色位置追蹤 - tom*", "*🎯 角色3格範圍內的Boss*", "*🔴 BIG BOSS 距離*"]
+
+    # 長度限制以跳脫後的mrkdwn計算，且不會切開跳脫序列
+    escaped = RenderedMessage.from_text("<&>" * 1000)
+    sections = [block["text"]["text"] for _, blocks in escaped.block_chunks() for block in blocks]
+    assert all(len(text) <= SLACK_SECTION_TEXT_LIMIT for text in sections)
+    unescaped = "".join(sections).replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+    assert unescaped == "<&>" * 1000
+
+    # 分段發送時只重試失敗的段落，已送達的段落不會重發
+    posted = []
+    statuses = iter([200, 500, 200, 200])
+
+    def fake_post(url, json=None, timeout=None):
+        response = requests.Response()
+        response.status_code = next(statuses)
+        posted.append((json["text"], response.status_code))
+        return response
+
+    sink = SlackNotifier("slack", "http://example.invalid/webhook", retry_backoff=0)
+    original_post = notifiers.requests.post
+    notifiers.requests.post = fake_post
+    try:
+        chunks = sink.render(RenderedMessage.from_text("a" * 4000 + "\n" + "b" * 4000 + "\n" + "c" * 10))
+        assert len(chunks) == 3
+        assert sink.send(chunks)
+    finally:
+        notifiers.requests.post = original_post
+        sink.close()
+    assert [text[0] for text, _ in posted] == ["a", "b", "b", "c"]
+    return True
+
+
+def write_settings(path, text):
+    """寫入設定檔並推進修改時間，確保監看者能察覺變更"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_settings_reload():
+    """測試設定檔熱重載：排程、角色列表和通知渠道更新而不遺失狀態"""
+    print("\n=== 測試設定熱重載 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config.toml")
+        write_settings(path, '[users]\na = "1"\nb = "2"\n\n[intervals]\ncheck = 5\n')
+        store = SettingsStore(path)
+        settings = store.current
+        assert settings.user_ids == ("1", "2") and settings.default_user_id == "1"
+
+        clock = SimulatedClock(datetime(2026, 1, 1, 12, 0).timestamp())
+        transport = ReplayTransport([{"time": clock.time(), "bossmap": make_sample_bossmap(clock.time())}], clock)
+        monitor = BossMonitor("1", clock=clock, transport=transport, settings=settings)
+        sent = []
+        monitor.send_notification = lambda message, channel=None: sent.append(message) or True
+        monitor.check_and_notify()
+        known_bosses = dict(monitor.current_big_bosses)
+        assert len(sent) == 1 and known_bosses
+
+        monitor.sync_schedule(monitor._boss_detection_jobs())
+        cleanup_job = monitor._jobs['cleanup_expired_bosses']
+
+        # 設定有誤（包括渠道的鍵名錯誤）時保留舊設定
+        for broken in ('[intervals]\ncheck = -1\n',
+                       '[[sinks]]\ntype = "slack"\nwebhook = "http://127.0.0.1:9/"\n',
+                       '[[sinks]]\ntype = "slack"\nwebhook_url = "http://127.0.0.1:9/"\nstyle = "fancy"\n'):
+            write_settings(path, broken)
+            assert not store.reload()
+            assert store.current is settings
+
+        monitor.position_cache.record("1", "a", 1000, 990, clock.time())
+        monitor.position_cache.record("1", "a", 1001, 990, clock.time() + 60)
+        write_settings(path, 'position_history_size = 1\n\n[users]\nb = "2"\nc = "3"\n\n[intervals]\ncheck = 2\n\n'
+                             '[[sinks]]\ntype = "push"\nname = "phone"\nurl = "http://127.0.0.1:9/"\n')
+        assert store.reload()
+        monitor.apply_settings(store.current)
+        monitor.sync_schedule(monitor._boss_detection_jobs())
+        print(f"新設定: 角色 {store.current.user_ids}, 檢查間隔 {store.current.check_interval_minutes} 分鐘")
+        assert monitor._jobs['check_and_notify'].interval == 2
+        assert monitor._jobs['cleanup_expired_bosses'] is cleanup_job
+        assert [notifier.name for notifier in monitor.dispatcher.notifiers] == ["phone"]
+        assert list(monitor.position_cache.history("1")) == [(clock.time() + 60, 1001, 990)]
+
+        # 已通知的boss不會在重載後再次通知
+        monitor.check_and_notify()
+        assert monitor.current_big_bosses == known_bosses
+        assert len(sent) == 1
+        monitor.dispatcher.close()
+        for job in monitor._jobs.values():
+            schedule.cancel_job(job)
+
+        tracker = ShardedLocationTracker(["1", "2"], num_workers=1, dispatcher=NotificationDispatcher([]),
+                                         settings=settings)
+        try:
+            kept = tracker.monitors["2"]
+            tracker.apply_settings(store.current)
+            assert sorted(tracker.monitors) == ["2", "3"]
+            assert tracker.monitors["2"] is kept
+            assert tracker.monitors["3"].position_cache is kept.position_cache
+        finally:
+            tracker.close()
+    return True
+
+
 def main():
     """主測試函數"""
     print("Boss監控系統測試開始")
@@ -97,6 +531,14 @@ def main():
     tests = [
         ("網頁爬蟲", test_fetch_boss_data),
         ("訊息格式化", test_message_formatting),
+        ("多渠道派發", test_notification_dispatch),
+        ("分片追蹤", test_sharded_tracking),
+        ("地圖格子", test_map_grid),
+        ("回放引擎", test_replay_engine),
+        ("負載測試工具", test_load_harness),
+        ("位置緩存", test_position_cache),
+        ("訊息渲染", test_rendering),
+        ("設定熱重載", test_settings_reload),
         ("Slack通知", test_slack_notification),
     ]
     
@@ -0,0 +1,61 @@
+"""
+HTTP 傳輸抽象
+
+BossMonitor 的所有 dfprofiler 請求都經過注入的 transport，
+方便回放錄製的快照或指向本地測試伺服器。
+"""
+
+import json
+import threading
+from typing import Dict, Optional
+
+import requests
+
+
+class HttpTransport:
+    """使用 requests 的實際HTTP傳輸"""
+
+    def __init__(self, session: Optional[requests.Session] = None):
+        self.session = session or requests.Session()
+
+    def get_json(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        """GET 並解析JSON，HTTP錯誤時拋出 requests 異常"""
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get_text(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> str:
+        """GET 並返回原始文字，供只需要部分欄位的呼叫者自行擷取"""
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response.text
+
+
+class RecordingTransport:
+    """包裝另一個transport，把每次回應連同時間寫入JSONL錄製檔"""
+
+    def __init__(self, inner, path: str, clock):
+        self.inner = inner
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def get_json(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        data = self.inner.get_json(url, headers=headers, timeout=timeout)
+        self._record(url, data)
+        return data
+
+    def get_text(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30) -> str:
+        text = self.inner.get_text(url, headers=headers, timeout=timeout)
+        self._record(url, json.loads(text))
+        return text
+
+    def _record(self, url: str, data):
+        frame = {"time": self.clock.time()}
+        if "/profile/json/" in url:
+            user_id = url.split("/profile/json/", 1)[1].split("?", 1)[0]
+            frame["profiles"] = {user_id: data}
+        else:
+            frame["bossmap"] = data
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(frame, ensure_ascii=False) + "\n")